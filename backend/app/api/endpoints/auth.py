@@ -1,17 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.session import get_session
 from sqlalchemy.future import select
 from passlib.context import CryptContext
-from utils.utils import hash_password, verify_password, create_access_token, verify_access_token, oauth2_scheme_user
-from db.models import User, BusinessUnit, Inventory
-from schemas.auth import UserCreate, UserLogin, UserResponse, Token, UserOut, UserUpdate, GenderCountOut
+from utils.utils import hash_password_async, verify_password_async, password_hasher, create_access_token, get_current_user, get_token_user, invalidate_cached_user, user_cache, build_token_claims, revoke_user_tokens, issue_refresh_token, revoke_refresh_tokens, hash_refresh_token
+from db.models import User, BusinessUnit, Inventory, RefreshToken
+from schemas.auth import UserCreate, UserLogin, UserResponse, Token, UserOut, UserUpdate, GenderCountOut, CurrentUser, RefreshRequest, EmployeeBulkResult
 from schemas.inventory import InventoryCreate
 from schemas.business_unit import BusinessUnitCreate
+from utils.employees import parse_employee_rows, create_employees_bulk
+from utils.data_version import bump_data_version
+from utils.feed import inventory_feed, notification_feed, queue_inventory_event
+from utils.inventory import adjust_inventory_unit_stats, is_low_stock, invalidate_inventory_name_index
+from utils.sales import rebuild_sales_rollups
+from utils.notifications import open_low_stock_notifications
+from core.config import settings
 from fastapi.security import OAuth2PasswordRequestForm
 from datetime import timedelta, datetime
-from typing import List, Dict
-from sqlalchemy import func
+from typing import List, Dict, Optional
+from sqlalchemy import func, delete
+from sqlalchemy.exc import IntegrityError
 
 
 
@@ -33,8 +41,10 @@ async def admin_login(
     statement = select(User).where(User.name == form_data.username)
     result = await db.execute(statement)
     user = result.scalars().first()
+    # Release the connection while the password waits for the hashing pool
+    await db.close()
 
-    if user is None or not verify_password(form_data.password, user.password_hash):
+    if user is None or not await verify_password_async(form_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
@@ -42,35 +52,27 @@ async def admin_login(
 
     # Create JWT token on successful login
     access_token = create_access_token(
-        data={"sub": user.email}, expires_delta=timedelta(hours=1)
+        data=build_token_claims(user), expires_delta=timedelta(hours=1)
     )
-    return Token(access_token=access_token, token_type="bearer")
+    refresh_token = await issue_refresh_token(db, user.id)
+    await db.commit()
+
+    return Token(access_token=access_token, token_type="bearer", refresh_token=refresh_token)
 
 @router.post("/admin/create-business-unit", response_model=BusinessUnit)
 async def create_business_unit(
     business_unit_create: BusinessUnitCreate,
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """
     Create a business unit: Only admins can create a business unit.
     """
 
     print(business_unit_create)
-    # Verify the token to ensure the user is admin
-    payload = verify_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-        )
 
     # Check if the user is admin
-    statement = select(User).where(User.email == payload["sub"])
-    result = await db.execute(statement)
-    current_user = result.scalars().first()
-
-    if current_user is None or current_user.role != "admin":
+    if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only admins can create business units",
@@ -92,25 +94,13 @@ async def create_business_unit(
 @router.get("/admin/list-details", response_model=List[UserResponse])
 async def list_employees(
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user)
+    current_user: CurrentUser = Depends(get_token_user)
 ):
     """
     List all employees: Only admins can view the list of employees.
     """
-    # Verify the token to ensure the user is admin
-    payload = verify_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-        )
-
     # Check if the user is admin
-    statement = select(User).where(User.email == payload["sub"])
-    result = await db.execute(statement)
-    current_user = result.scalars().first()
-
-    if current_user is None or current_user.role != "admin":
+    if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only admins can view the list of employees",
@@ -129,22 +119,10 @@ async def list_employees(
 async def create_employee(
     user_create: UserCreate,
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    # Verify admin token
-    payload = verify_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-        )
-
     # Check if the user is admin
-    statement = select(User).where(User.email == payload["sub"])
-    result = await db.execute(statement)
-    current_user = result.scalars().first()
-
-    if current_user is None or current_user.role != "admin":
+    if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only admins can create employees",
@@ -181,7 +159,7 @@ async def create_employee(
         gender=user_create.gender,  # Include gender if provided
         unit_id=user_create.unit_id,
         created_at=datetime.now(),
-        password_hash=hash_password(user_create.password),
+        password_hash=await hash_password_async(user_create.password),
     )
     db.add(employee)
     await db.commit()
@@ -189,26 +167,52 @@ async def create_employee(
 
     return employee
 
-@router.delete("/admin/delete-employee/{employee_id}", response_model=dict)
-async def delete_employee(
-    employee_id: int,
+@router.post("/admin/create-employees-bulk", response_model=EmployeeBulkResult)
+async def create_employees(
+    request: Request,
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user),
+    current_user: CurrentUser = Depends(get_current_user)
 ):
-    # Verify admin token
-    payload = verify_access_token(token)
-    if payload is None:
+    """
+    Create many employees at once: Only admins can create employees.
+    The body is a JSON array of UserCreate objects, or CSV (Content-Type: text/csv)
+    with a name,email,password,gender,unit_id header. Valid rows are created in one
+    transaction; the others are reported per row.
+    """
+    # Check if the user is admin
+    if current_user.role != "admin":
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can create employees",
         )
 
-    # Check if the user is admin
-    statement = select(User).where(User.email == payload["sub"])
-    result = await db.execute(statement)
-    current_user = result.scalars().first()
+    try:
+        rows = parse_employee_rows(await request.body(), request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid upload: {e}",
+        )
+
+    if len(rows) > settings.EMPLOYEE_BULK_MAX_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.EMPLOYEE_BULK_MAX_ROWS} employees can be created at once",
+        )
+
+    employees, errors = await create_employees_bulk(db, rows)
+    await db.commit()
+
+    return {"created": employees, "errors": errors}
 
-    if current_user is None or current_user.role != "admin":
+@router.delete("/admin/delete-employee/{employee_id}", response_model=dict)
+async def delete_employee(
+    employee_id: int,
+    db: AsyncSession = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    # Check if the user is admin
+    if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only admins can delete employees",
@@ -225,9 +229,13 @@ async def delete_employee(
             detail="Employee not found",
         )
 
-    # Delete employee
+    # Delete employee and revoke any tokens still in circulation
+    employee_email = employee.email
+    revoke_user_tokens(employee)
+    await db.execute(delete(RefreshToken).where(RefreshToken.user_id == employee.id))
     await db.delete(employee)
     await db.commit()
+    invalidate_cached_user(employee_email)
 
     return {"message": "Employee deleted successfully"}
 
@@ -236,22 +244,10 @@ async def update_employee(
     employee_id: int,
     user_update: UserUpdate,
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
-    # Verify admin token
-    payload = verify_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-        )
-
     # Check if the user is admin
-    statement = select(User).where(User.email == payload["sub"])
-    result = await db.execute(statement)
-    current_user = result.scalars().first()
-
-    if current_user is None or current_user.role != "admin":
+    if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only admins can update employees",
@@ -269,6 +265,7 @@ async def update_employee(
         )
 
     # Update the employee details
+    previous_email = employee.email
     if user_update.name:
         employee.name = user_update.name
     if user_update.email:
@@ -282,7 +279,10 @@ async def update_employee(
             )
         employee.email = user_update.email
     if user_update.password:
-        employee.password_hash = hash_password(user_update.password)
+        employee.password_hash = await hash_password_async(user_update.password)
+        # A reset password must end every session started with the old one
+        revoke_user_tokens(employee)
+        await revoke_refresh_tokens(db, employee.id)
     if user_update.unit_id:
         # Validate business unit
         statement = select(BusinessUnit).where(BusinessUnit.id == user_update.unit_id)
@@ -293,12 +293,16 @@ async def update_employee(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Business unit not found",
             )
+        if employee.unit_id != user_update.unit_id:
+            # Tokens carry the unit, so the ones already issued must go
+            revoke_user_tokens(employee)
         employee.unit_id = user_update.unit_id
     if user_update.gender:
         employee.gender = user_update.gender
 
     await db.commit()
     await db.refresh(employee)
+    invalidate_cached_user(previous_email, employee.email)
 
     return employee
 
@@ -306,25 +310,13 @@ async def update_employee(
 @router.get("/admin/list-stats", response_model=dict)  # Change response_model to dict for multiple values
 async def get_admin_stats(
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user)
+    current_user: CurrentUser = Depends(get_token_user)
 ):
     """
     Get the total count of employees and business units: Only admins can access this data.
     """
-    # Verify the token to ensure the user is admin
-    payload = verify_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-        )
-
     # Check if the user is admin
-    statement = select(User).where(User.email == payload["sub"])
-    result = await db.execute(statement)
-    current_user = result.scalars().first()
-
-    if current_user is None or current_user.role != "admin":
+    if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only admins can access stats",
@@ -347,29 +339,70 @@ async def get_admin_stats(
     }
 
 
+@router.get("/admin/metrics", response_model=dict)
+async def get_admin_metrics(
+    current_user: CurrentUser = Depends(get_token_user)
+):
+    """
+    Get in-process cache and password hashing counters: Only admins can access this data.
+    """
+    # Check if the user is admin
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can access metrics",
+        )
+
+    return {
+        "user_cache": user_cache.stats(),
+        "password_hashing": password_hasher.stats(),
+        "inventory_feed": inventory_feed.stats(),
+        "notification_feed": notification_feed.stats(),
+    }
+
+
+@router.post("/admin/rebuild-sales-rollups", response_model=dict)
+async def rebuild_sales_rollups_endpoint(
+    unit_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_session),
+    current_user: CurrentUser = Depends(get_token_user),
+):
+    """
+    Recompute the daily sales rollups behind the financial reports from the order
+    history, for one unit or every unit: Only admins can do this. Order placement
+    waits until the rebuild has committed.
+    """
+    # Check if the user is admin
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can rebuild sales rollups",
+        )
+
+    if unit_id is None:
+        result = await db.execute(select(BusinessUnit.id))
+        unit_ids = result.scalars().all()
+    else:
+        unit_ids = [unit_id]
+
+    await rebuild_sales_rollups(db, None if unit_id is None else unit_ids)
+    await bump_data_version(db, unit_ids)
+    await db.commit()
+
+    return {"message": "Sales rollups rebuilt successfully", "unit_ids": unit_ids}
+
+
 @router.post("/admin/create-inventory", response_model=Inventory)
 async def create_inventory(
     inventory_create: InventoryCreate,
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """
     Create an inventory item: Only admins can create inventory items.
     """
-    # Verify the token to ensure the user is admin
-    payload = verify_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-        )
-
     # Check if the user is admin
-    statement = select(User).where(User.email == payload["sub"])
-    result = await db.execute(statement)
-    current_user = result.scalars().first()
-
-    if current_user is None or current_user.role != "admin":
+    if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only admins can create inventory items",
@@ -397,7 +430,25 @@ async def create_inventory(
         created_at=datetime.utcnow(),
     )
     db.add(inventory)
-    await db.commit()
+    is_low = is_low_stock(inventory.quantity, inventory.reorder_level)
+    try:
+        # Flush first: a duplicate name fails here, not in an autoflush further down
+        await db.flush()
+        await adjust_inventory_unit_stats(db, {inventory.unit_id: (1, int(is_low))})
+        if is_low:
+            await open_low_stock_notifications(
+                db, [(inventory.id, inventory.unit_id, inventory.name, inventory.quantity)]
+            )
+        await bump_data_version(db, [inventory.unit_id])
+        queue_inventory_event(db, inventory.unit_id, {"type": "upsert", "item": inventory.model_dump()})
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Inventory item already exists in this business unit",
+        )
+    invalidate_inventory_name_index(inventory.unit_id)
     await db.refresh(inventory)
 
     return inventory
@@ -423,8 +474,10 @@ async def login(
     statement = select(User).where(User.email == user.email)
     result = await db.execute(statement)
     db_user = result.scalars().first()
+    # Release the connection while the password waits for the hashing pool
+    await db.close()
 
-    if db_user is None or not verify_password(user.password, db_user.password_hash):
+    if db_user is None or not await verify_password_async(user.password, db_user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
@@ -432,7 +485,111 @@ async def login(
 
     # Generate JWT access token on successful login
     access_token = create_access_token(
-        data={"sub": db_user.email, "role": db_user.role}, expires_delta=timedelta(hours=1)
+        data=build_token_claims(db_user), expires_delta=timedelta(hours=1)
     )
+    refresh_token = await issue_refresh_token(db, db_user.id)
+    await db.commit()
+
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+
+@router.post("/refresh", response_model=Token)
+async def refresh_access_token(
+    refresh_request: RefreshRequest, db: AsyncSession = Depends(get_session)
+):
+    """
+    Exchange a refresh token for a new access token without re-entering the password.
+    The refresh token is rotated on every use; presenting an already used token
+    revokes every session of its user.
+    """
+    statement = (
+        select(RefreshToken)
+        .where(RefreshToken.token_hash == hash_refresh_token(refresh_request.refresh_token))
+        .with_for_update()
+    )
+    result = await db.execute(statement)
+    stored_token = result.scalars().first()
+
+    if stored_token is None or stored_token.expires_at < datetime.utcnow():
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+        )
+
+    # A rotated token coming back means it leaked, so end all of the user's sessions
+    if stored_token.revoked:
+        await revoke_refresh_tokens(db, stored_token.user_id)
+        await db.commit()
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token has already been used",
+        )
+
+    statement = select(User).where(User.id == stored_token.user_id)
+    result = await db.execute(statement)
+    db_user = result.scalars().first()
+
+    if db_user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+        )
+
+    # Rotate the refresh token and issue a new access token from the current user row
+    stored_token.revoked = True
+    refresh_token = await issue_refresh_token(db, db_user.id)
+    access_token = create_access_token(
+        data=build_token_claims(db_user), expires_delta=timedelta(hours=1)
+    )
+    await db.commit()
+
+    return Token(access_token=access_token, token_type="bearer", refresh_token=refresh_token)
+
+
+@router.post("/logout", response_model=dict)
+async def logout(
+    db: AsyncSession = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Revoke every refresh token of the current user.
+    """
+    await revoke_refresh_tokens(db, current_user.id)
+    await db.commit()
+
+    return {"message": "Logged out successfully"}
+
+
+@router.post("/admin/revoke-sessions/{user_id}", response_model=dict)
+async def revoke_sessions(
+    user_id: int,
+    db: AsyncSession = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Revoke every refresh and access token of a user: Only admins can revoke sessions.
+    """
+    # Check if the user is admin
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can revoke sessions",
+        )
+
+    statement = select(User).where(User.id == user_id)
+    result = await db.execute(statement)
+    user = result.scalars().first()
+
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found",
+        )
+
+    user_email = user.email
+    revoke_user_tokens(user)
+    await revoke_refresh_tokens(db, user.id)
+    await db.commit()
+    invalidate_cached_user(user_email)
 
-    return {"access_token": access_token, "token_type": "bearer"}
+    return {"message": "Sessions revoked successfully"}
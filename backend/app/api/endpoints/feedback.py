@@ -7,7 +7,9 @@ from db.models import Feedback, User, BusinessUnit
 from db.session import get_session
 from sqlalchemy.orm import selectinload
 from schemas.feedback import FeedbackCreate, FeedbackResponse
-from utils.utils import verify_access_token, oauth2_scheme_user
+from schemas.auth import CurrentUser
+from utils.utils import get_current_user, get_token_user
+from utils.data_version import bump_data_version, check_data_version
 
 router = APIRouter()
 
@@ -16,26 +18,14 @@ router = APIRouter()
 async def create_feedback(
     feedback: FeedbackCreate,
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user)
+    current_user: CurrentUser = Depends(get_current_user)
 ):
     """
     Create feedback: Only customers can provide feedback.
     Customers provide feedback based on business unit name.
     """
-    # Verify token and get user info
-    payload = verify_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-        )
-
-    # Fetch the current user
-    statement = select(User).where(User.email == payload["sub"])
-    result = await db.execute(statement)
-    current_user = result.scalars().first()
-
-    if current_user is None or current_user.role != "customer":
+    # Check the user's role
+    if current_user.role != "customer":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only customers can provide feedback",
@@ -60,6 +50,7 @@ async def create_feedback(
         rating=feedback.rating,
     )
     db.add(new_feedback)
+    await bump_data_version(db, [business_unit.id])
     await db.commit()
     await db.refresh(new_feedback)
 
@@ -70,6 +61,7 @@ async def create_feedback(
         comment=new_feedback.comment,
         rating=new_feedback.rating,
         created_at=new_feedback.created_at,
+        customer_name=current_user.name,
         unit_name=business_unit.name,
     )
 
@@ -78,33 +70,18 @@ async def create_feedback(
 
 
 
-@router.get("/list-feedbacks", response_model=List[FeedbackResponse])
+@router.get(
+    "/list-feedbacks",
+    response_model=List[FeedbackResponse],
+    dependencies=[Depends(check_data_version)],
+)
 async def get_feedback(
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user)
+    current_user: CurrentUser = Depends(get_token_user)
 ):
     """
     Get feedback: Admins can see all feedback; Employees can see feedback for their unit only.
     """
-    # Verify token and get user info
-    payload = verify_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-        )
-
-    # Fetch the current user
-    statement = select(User).where(User.email == payload["sub"])
-    result = await db.execute(statement)
-    current_user = result.scalars().first()
-
-    if current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Invalid user",
-        )
-
     # Define base query
     base_query = (
         select(
@@ -1,71 +1,75 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.sql import func, extract
+from sqlalchemy.sql import func
 from db.session import get_session
 from sqlmodel import select
-from db.models import FinancialReport, Order, OrderItem, Inventory, User, BusinessUnit
+from db.models import (
+    FinancialReport,
+    Inventory,
+    User,
+    BusinessUnit,
+    DailyUnitSales,
+    DailyItemSales,
+    DailyCustomerSales,
+)
 from schemas.financial_reports import (
     SalesReportSchema,
+    MonthlySalesReportSchema,
+    SalesTimeSeriesPointSchema,
     InventoryValuationSchema,
     RevenueByProductSchema,
     TopCustomersReportSchema,
 )
-from utils.utils import verify_access_token, oauth2_scheme_user
+from schemas.auth import CurrentUser
+from utils.utils import get_token_user
+from utils.data_version import check_data_version
+from utils.sales import sales_time_series, sales_date_range, bucket_count, bucket_starts, bucket_start, next_bucket_start
+from core.config import settings
+from datetime import date
+from typing import Literal, Optional
 
-router = APIRouter()
+# Every report is answered with 304 while its unit's data is unchanged
+router = APIRouter(dependencies=[Depends(check_data_version)])
 
 
-async def get_current_user(
-    token: str, db: AsyncSession
-) -> User:
+def scope_report_unit(current_user: CurrentUser, unit_id: Optional[int] = None) -> Optional[int]:
     """
-    Utility function to retrieve the current user from the token.
+    Resolve which unit a report covers: admins may pick any unit (or none, for
+    every unit), employees only their assigned unit.
     """
-    payload = verify_access_token(token)
-    if not payload:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token"
-        )
-
-    statement = select(User).where(User.email == payload["sub"])
-    result = await db.execute(statement)
-    current_user = result.scalars().first()
-
-    if not current_user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
-        )
-
-    return current_user
+    if current_user.role == "admin":
+        return unit_id
+    if current_user.role == "employee" and current_user.unit_id is not None:
+        if unit_id is not None and unit_id != current_user.unit_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You can only view reports for your assigned unit",
+            )
+        return current_user.unit_id
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Access denied: Invalid role",
+    )
 
 
 # --- Sales Report ---
 @router.get("/sales-report", response_model=SalesReportSchema)
 async def get_sales_report(
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user),
+    current_user: CurrentUser = Depends(get_token_user),
 ):
     """
     Endpoint to retrieve sales report.
     Admins see all, Employees are restricted to their assigned unit.
+    Read from the daily sales rollup.
     """
-    current_user = await get_current_user(token, db)
-
-    if current_user.role == "admin":
-        statement = select(
-            func.sum(Order.total_amount).label("total_sales"),
-            func.count(Order.id).label("order_count")
-        )
-    elif current_user.role == "employee":
-        statement = select(
-            func.sum(Order.total_amount).label("total_sales"),
-            func.count(Order.id).label("order_count")
-        ).where(Order.unit_id == current_user.unit_id)
-    else:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied: Invalid role",
-        )
+    unit_id = scope_report_unit(current_user)
+    statement = select(
+        func.sum(DailyUnitSales.total_sales).label("total_sales"),
+        func.sum(DailyUnitSales.order_count).label("order_count"),
+    )
+    if unit_id is not None:
+        statement = statement.where(DailyUnitSales.unit_id == unit_id)
 
     result = await db.execute(statement)
     total_sales, order_count = result.one()
@@ -77,14 +81,12 @@ async def get_sales_report(
 @router.get("/inventory-valuation", response_model=InventoryValuationSchema)
 async def get_inventory_valuation(
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user),
+    current_user: CurrentUser = Depends(get_token_user),
 ):
     """
     Endpoint to calculate inventory valuation.
     Admins see all, Employees are restricted to their assigned unit.
     """
-    current_user = await get_current_user(token, db)
-
     if current_user.role == "admin":
         statement = select(
             func.sum(Inventory.quantity * Inventory.price).label("total_valuation")
@@ -109,31 +111,24 @@ async def get_inventory_valuation(
 @router.get("/revenue-by-product", response_model=list[RevenueByProductSchema])
 async def get_revenue_by_product(
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user),
+    current_user: CurrentUser = Depends(get_token_user),
 ):
     """
     Endpoint to calculate revenue by product.
     Admins see all, Employees are restricted to their assigned unit.
+    Read from the daily per-item sales rollup.
     """
-    current_user = await get_current_user(token, db)
-
-    if current_user.role == "admin":
-        statement = select(
-            Inventory.name.label("product_name"),
-            func.sum(OrderItem.quantity * OrderItem.price).label("total_revenue"),
-        ).join(Inventory, Inventory.id == OrderItem.inventory_id).group_by(Inventory.name)
-    elif current_user.role == "employee":
-        statement = select(
+    unit_id = scope_report_unit(current_user)
+    statement = (
+        select(
             Inventory.name.label("product_name"),
-            func.sum(OrderItem.quantity * OrderItem.price).label("total_revenue"),
-        ).join(Inventory, Inventory.id == OrderItem.inventory_id).where(
-            Inventory.unit_id == current_user.unit_id
-        ).group_by(Inventory.name)
-    else:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied: Invalid role",
+            func.sum(DailyItemSales.revenue).label("total_revenue"),
         )
+        .join(Inventory, Inventory.id == DailyItemSales.inventory_id)
+        .group_by(Inventory.name)
+    )
+    if unit_id is not None:
+        statement = statement.where(DailyItemSales.unit_id == unit_id)
 
     result = await db.execute(statement)
     products = result.all()
@@ -145,84 +140,93 @@ async def get_revenue_by_product(
 @router.get("/top-customers", response_model=list[TopCustomersReportSchema])
 async def get_top_customers(
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user),
+    current_user: CurrentUser = Depends(get_token_user),
 ):
     """
     Endpoint to retrieve the top customers by revenue.
     Admins see all, Employees are restricted to their assigned unit.
+    Read from the daily per-customer sales rollup.
     """
-    current_user = await get_current_user(token, db)
-
-    if current_user.role == "admin":
-        statement = select(
-            User.name.label("customer_name"),
-            func.sum(Order.total_amount).label("total_spent"),
-        ).join(User, User.id == Order.user_id).group_by(User.name).order_by(
-            func.sum(Order.total_amount).desc()
-        )
-    elif current_user.role == "employee":
-        statement = select(
-            User.name.label("customer_name"),
-            func.sum(Order.total_amount).label("total_spent"),
-        ).join(User, User.id == Order.user_id).where(
-            Order.unit_id == current_user.unit_id
-        ).group_by(User.name).order_by(func.sum(Order.total_amount).desc())
-    else:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied: Invalid role",
-        )
+    unit_id = scope_report_unit(current_user)
+    total_spent = func.sum(DailyCustomerSales.total_spent)
+    statement = (
+        select(User.name.label("customer_name"), total_spent.label("total_spent"))
+        .join(User, User.id == DailyCustomerSales.user_id)
+        .group_by(User.name)
+        .order_by(total_spent.desc())
+    )
+    if unit_id is not None:
+        statement = statement.where(DailyCustomerSales.unit_id == unit_id)
 
     result = await db.execute(statement)
     customers = result.all()
 
     return [{"customer_name": c.customer_name, "total_spent": c.total_spent} for c in customers]
 
-@router.get("/sales-report/monthly", response_model=list[SalesReportSchema])
-async def get_monthly_sales_report(
+@router.get("/sales-report/timeseries", response_model=list[SalesTimeSeriesPointSchema])
+async def get_sales_time_series(
+    start: date,
+    end: date,
+    unit_id: Optional[int] = None,
+    granularity: Literal["day", "week", "month"] = Query("day"),
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user),
+    current_user: CurrentUser = Depends(get_token_user),
 ):
     """
-    Endpoint to retrieve monthly sales report.
-    Admins see all, Employees are restricted to their assigned unit.
+    Endpoint to retrieve sales per day, week or month between `start` (inclusive)
+    and `end` (exclusive). Every bucket in the range is returned, with zeros when
+    there were no sales; weeks start on Monday.
+    Admins see all units (or `unit_id`), Employees are restricted to their assigned unit.
     """
-    current_user = await get_current_user(token, db)
+    unit_id = scope_report_unit(current_user, unit_id)
 
-    # Base query for monthly aggregation
-    if current_user.role == "admin":
-        statement = select(
-            extract("year", Order.created_at).label("year"),
-            extract("month", Order.created_at).label("month"),
-            func.sum(Order.total_amount).label("total_sales"),
-            func.count(Order.id).label("order_count"),
-        ).group_by(extract("year", Order.created_at), extract("month", Order.created_at)).order_by(
-            extract("year", Order.created_at), extract("month", Order.created_at)
+    if start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="start must be before end",
         )
-    elif current_user.role == "employee":
-        statement = select(
-            extract("year", Order.created_at).label("year"),
-            extract("month", Order.created_at).label("month"),
-            func.sum(Order.total_amount).label("total_sales"),
-            func.count(Order.id).label("order_count"),
-        ).where(Order.unit_id == current_user.unit_id).group_by(
-            extract("year", Order.created_at), extract("month", Order.created_at)
-        ).order_by(extract("year", Order.created_at), extract("month", Order.created_at))
-    else:
+    # Count arithmetically so an oversized range is refused before any list is built
+    if bucket_count(start, end, granularity) > settings.SALES_TIMESERIES_MAX_BUCKETS:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied: Invalid role",
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.SALES_TIMESERIES_MAX_BUCKETS} buckets can be returned; narrow the range or use a coarser granularity",
         )
 
-    result = await db.execute(statement)
-    monthly_sales = result.all()
+    buckets = bucket_starts(start, end, granularity)
+    return await sales_time_series(db, start, end, unit_id, granularity, buckets)
+
+
+@router.get("/sales-report/monthly", response_model=list[MonthlySalesReportSchema])
+async def get_monthly_sales_report(
+    db: AsyncSession = Depends(get_session),
+    current_user: CurrentUser = Depends(get_token_user),
+):
+    """
+    Endpoint to retrieve monthly sales report, from the first to the last month
+    with sales; months without sales are reported with zeros.
+    Admins see all, Employees are restricted to their assigned unit.
+    """
+    unit_id = scope_report_unit(current_user)
+
+    date_range = await sales_date_range(db, unit_id)
+    if date_range is None:
+        return []
+    first_day, last_day = date_range
+
+    points = await sales_time_series(
+        db,
+        bucket_start(first_day, "month"),
+        next_bucket_start(bucket_start(last_day, "month"), "month"),
+        unit_id,
+        "month",
+    )
 
     return [
         {
-            "year": int(s.year),
-            "month": int(s.month),
-            "total_sales": s.total_sales or 0,
-            "order_count": s.order_count or 0,
+            "year": point["period_start"].year,
+            "month": point["period_start"].month,
+            "total_sales": point["total_sales"],
+            "order_count": point["order_count"],
         }
-        for s in monthly_sales
+        for point in points
     ]
@@ -1,60 +1,286 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, WebSocket
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from db.session import get_session
+from db.session import get_session, AsyncSessionLocal
 from sqlmodel import select
-from db.models import Inventory, User, BusinessUnit
-from schemas.inventory import InventoryUpdate, InventoryCreate  # Assuming schemas for inventory
-from utils.utils import verify_access_token, oauth2_scheme_user
+from db.models import Inventory, BusinessUnit
+from schemas.inventory import InventoryUpdate, InventoryCreate, InventoryBatchUpdate  # Assuming schemas for inventory
+from schemas.auth import CurrentUser
+from utils.utils import get_current_user, get_token_user
+from utils.data_version import bump_data_version, check_data_version
+from utils.feed import inventory_feed, queue_inventory_event
+from utils.notifications import open_low_stock_notifications, resolve_restocked_notifications, delete_inventory_notifications
+from core.config import settings
+from utils.inventory import stream_inventory, get_inventory_stats, adjust_inventory_unit_stats, is_low_stock, import_inventory_csv, update_inventory_batch, search_inventory, get_inventory_name_index, invalidate_inventory_name_index
+from typing import List, Optional
+import asyncio
+import contextlib
+import csv
+import tempfile
 
 router = APIRouter()
 
+def scope_inventory_unit(current_user: CurrentUser, unit_id: Optional[int]) -> Optional[int]:
+    """
+    Resolve which unit's inventory the caller may list: admins may pick any unit
+    (or none, for all units), employees only their assigned unit.
+    """
+    if current_user.role == "admin":
+        return unit_id
+    if current_user.role == "employee":
+        if unit_id is not None and unit_id != current_user.unit_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You can only view inventory for your assigned unit",
+            )
+        return current_user.unit_id
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Access denied: Invalid role",
+    )
+
+
 # View inventory (Admins see all, Employees see assigned unit's inventory)
-@router.get("/", response_model=list[Inventory])
+@router.get("/", response_model=list[Inventory], dependencies=[Depends(check_data_version)])
 async def list_inventory(
-    db: AsyncSession = Depends(get_session), token: str = Depends(oauth2_scheme_user)
+    unit_id: Optional[int] = None,
+    after_id: Optional[int] = Query(None, description="Return items with an id after this one"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    db: AsyncSession = Depends(get_session), current_user: CurrentUser = Depends(get_token_user)
 ):
     """
-    Endpoint to list inventory items.
+    Endpoint to list inventory items, ordered by id.
     Admins can view all inventory, Employees can view inventory only for their assigned unit.
+    Pass `limit` to page through the results, and the last id of a page as `after_id`
+    to get the next one. Without `limit` every matching item is returned.
+    """
+    unit_id = scope_inventory_unit(current_user, unit_id)
+
+    statement = select(Inventory)
+    if unit_id is not None:
+        statement = statement.where(Inventory.unit_id == unit_id)
+    if after_id is not None:
+        statement = statement.where(Inventory.id > after_id)
+    statement = statement.order_by(Inventory.id)
+    if limit is not None:
+        statement = statement.limit(limit)
+
+    result = await db.execute(statement)
+    inventory_items = result.scalars().all()
+
+    return inventory_items
+
+
+@router.get("/stream")
+async def stream_inventory_items(
+    unit_id: Optional[int] = None,
+    format: str = Query("ndjson", pattern="^(ndjson|json)$"),
+    db: AsyncSession = Depends(get_session), current_user: CurrentUser = Depends(get_token_user)
+):
+    """
+    Endpoint to export inventory items as NDJSON (default) or a JSON array, streamed
+    from a server-side cursor so large catalogs are never held in memory at once.
+    Admins can export all inventory, Employees only their assigned unit's inventory.
+    """
+    unit_id = scope_inventory_unit(current_user, unit_id)
+    await db.close()
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
+    return StreamingResponse(stream_inventory(unit_id, format), media_type=media_type)
+
+
+@router.websocket("/feed")
+async def inventory_change_feed(
+    websocket: WebSocket,
+    token: str = Query(...),
+    unit_id: Optional[int] = None,
+):
+    """
+    WebSocket feed of inventory changes, as JSON messages published after each commit:
+    - {"type": "stock", "unit_id", "items": [{"id", "name", "quantity"}]} after orders.
+    - {"type": "upsert", "unit_id", "item"} after an item is created or updated.
+    - {"type": "delete", "unit_id", "id"} after an item is deleted.
+    - {"type": "reload"} when changes were too many to send; refetch the inventory.
+    Browsers cannot set headers on a WebSocket, so the access token is passed as `token`.
+    Admins follow every unit (or `unit_id`), Employees their assigned unit.
+    Changes are fanned out within one process, so the app must run as a single worker.
+    """
+    # Authorize with a short-lived session so no connection is held while subscribed
+    try:
+        async with AsyncSessionLocal() as db:
+            current_user = await get_token_user(token, db)
+        unit_id = scope_inventory_unit(current_user, unit_id)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=str(e.detail))
+        return
+
+    await websocket.accept()
+    queue = inventory_feed.subscribe(unit_id)
+
+    async def send_events():
+        while True:
+            await websocket.send_text(await queue.get())
+
+    sender = asyncio.create_task(send_events())
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    finally:
+        sender.cancel()
+        inventory_feed.unsubscribe(unit_id, queue)
+        # Await the sender so a failed send is raised here instead of being lost
+        with contextlib.suppress(asyncio.CancelledError):
+            await sender
+
+
+@router.get("/search", response_model=list[Inventory])
+async def search_inventory_items(
+    q: str = Query(..., min_length=1, max_length=100),
+    unit_id: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_session), current_user: CurrentUser = Depends(get_token_user)
+):
+    """
+    Endpoint to search inventory items by partial name or description.
+    Admins can search all inventory, Employees only their assigned unit's inventory.
     """
-    # Verify the user's token
-    payload = verify_access_token(token)
-    if payload is None:
+    unit_id = scope_inventory_unit(current_user, unit_id)
+
+    return await search_inventory(db, q, unit_id, limit)
+
+
+@router.get("/autocomplete", response_model=list[dict])
+async def autocomplete_inventory_names(
+    prefix: str = Query(..., min_length=1, max_length=100),
+    unit_id: Optional[int] = None,
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_session), current_user: CurrentUser = Depends(get_token_user)
+):
+    """
+    Endpoint to complete item names for order entry, answered from an in-process
+    per-unit name index. Employees complete within their assigned unit; admins must
+    pass `unit_id`.
+    """
+    unit_id = scope_inventory_unit(current_user, unit_id)
+    if unit_id is None:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="unit_id is required",
         )
 
-    # Get current user from the payload
-    statement = select(User).where(User.email == payload["sub"])
-    result = await db.execute(statement)
-    current_user = result.scalars().first()
+    name_index = await get_inventory_name_index(db, unit_id)
+    return name_index.complete(prefix, limit)
 
-    if current_user is None:
+
+@router.post("/import", response_model=dict)
+async def import_inventory(
+    request: Request,
+    unit_id: Optional[int] = Query(None, description="Business unit for every row, instead of a unit_id column"),
+    db: AsyncSession = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Endpoint to import inventory items from a CSV upload: Only admins can import inventory.
+    The header is unit_id,name,description,quantity,reorder_level,price. Items that
+    already exist in the unit (by name) are updated, the others are created. Rows that
+    fail validation are skipped and reported; the import itself is one transaction.
+    """
+    # Check if the user is admin
+    if current_user.role != "admin":
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found",
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can import inventory items",
         )
 
-    # Admin can view all inventory
-    if current_user.role == "admin":
-        statement = select(Inventory)
-        result = await db.execute(statement)
-        inventory_items = result.scalars().all()
+    # Spool the upload (to disk once it grows) so memory stays flat however large it is
+    body = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    try:
+        async for data in request.stream():
+            body.write(data)
+        body.seek(0)
+
+        try:
+            summary = await import_inventory_csv(db, body, unit_id)
+        except (ValueError, csv.Error) as e:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid upload: {e}",
+            )
+        await db.commit()
+        invalidate_inventory_name_index()
+    finally:
+        body.close()
 
-    # Employees can only see inventory for their assigned unit
-    elif current_user.role == "employee":
-        statement = select(Inventory).where(Inventory.unit_id == current_user.unit_id)
-        result = await db.execute(statement)
-        inventory_items = result.scalars().all()
+    return summary
 
-    else:
+
+# Batch update inventory (declared before /{item_id} so "batch" is not read as an id)
+@router.put("/batch", response_model=list[Inventory])
+async def update_inventory_items(
+    inventory_updates: List[InventoryBatchUpdate],
+    db: AsyncSession = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Endpoint to update many inventory items at once, e.g. after a stock count.
+    Admins can update any inventory, Employees only inventory assigned to their unit.
+    Either every item is updated or, if any is missing or out of reach, none is.
+    """
+    if current_user.role not in ("admin", "employee"):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied: Invalid role",
         )
 
-    return inventory_items
+    if len(inventory_updates) > settings.INVENTORY_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.INVENTORY_BATCH_MAX_ITEMS} items can be updated at once",
+        )
+    if not inventory_updates:
+        return []
+
+    # Employees can only update items assigned to their unit
+    unit_id = None
+    if current_user.role == "employee":
+        if current_user.unit_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You can only update inventory for your assigned unit",
+            )
+        unit_id = current_user.unit_id
+
+    updated_rows = await update_inventory_batch(db, inventory_updates, unit_id)
+
+    missing = {item.id for item in inventory_updates} - {row.id for row in updated_rows}
+    if missing:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Inventory items not found in your business unit: {sorted(missing)}",
+        )
+    # Items left below their reorder level get a notification unless one is open,
+    # restocked items have theirs resolved
+    await open_low_stock_notifications(
+        db,
+        [
+            (row.id, row.unit_id, row.name, row.quantity)
+            for row in updated_rows
+            if is_low_stock(row.quantity, row.reorder_level)
+        ],
+    )
+    await resolve_restocked_notifications(
+        db, [row.id for row in updated_rows if not is_low_stock(row.quantity, row.reorder_level)]
+    )
+    await bump_data_version(db, {row.unit_id for row in updated_rows})
+    for row in updated_rows:
+        queue_inventory_event(db, row.unit_id, {"type": "upsert", "item": row._asdict()})
+    await db.commit()
+
+    return [row._asdict() for row in updated_rows]
 
 
 # Update inventory (Admins can update any, Employees can only update assigned unit's inventory)
@@ -63,32 +289,13 @@ async def update_inventory_item(
     item_id: int,
     inventory_update: InventoryUpdate,  # Assuming we have a schema for updating inventory
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user),
+    current_user: CurrentUser = Depends(get_current_user),
     unit_name: str = None  # Business unit name in the request
 ):
     """
     Endpoint to update inventory item details.
     Admins can update any inventory, Employees can only update inventory assigned to their unit.
     """
-    # Verify the user's token
-    payload = verify_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-        )
-
-    # Get current user from the payload
-    statement = select(User).where(User.email == payload["sub"])
-    result = await db.execute(statement)
-    current_user = result.scalars().first()
-
-    if current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found",
-        )
-
     # Fetch the unit based on the unit name
     if unit_name:
         unit_statement = select(BusinessUnit).where(BusinessUnit.name == unit_name)
@@ -104,8 +311,8 @@ async def update_inventory_item(
     else:
         unit_id = current_user.unit_id
 
-    # Fetch the inventory item by item_id
-    statement = select(Inventory).where(Inventory.id == item_id)
+    # Fetch and lock the inventory item by item_id, so was_low below cannot be stale
+    statement = select(Inventory).where(Inventory.id == item_id).with_for_update()
     result = await db.execute(statement)
     inventory_item = result.scalars().first()
 
@@ -133,10 +340,22 @@ async def update_inventory_item(
         )
 
     # Update the inventory item with the provided data
+    was_low = is_low_stock(inventory_item.quantity, inventory_item.reorder_level)
     for key, value in inventory_update.dict(exclude_unset=True).items():
         setattr(inventory_item, key, value)
+    is_low = is_low_stock(inventory_item.quantity, inventory_item.reorder_level)
 
     db.add(inventory_item)
+    await adjust_inventory_unit_stats(db, {inventory_item.unit_id: (0, int(is_low) - int(was_low))})
+    if is_low and not was_low:
+        await open_low_stock_notifications(
+            db, [(inventory_item.id, inventory_item.unit_id, inventory_item.name, inventory_item.quantity)]
+        )
+    elif was_low and not is_low:
+        await db.flush()
+        await resolve_restocked_notifications(db, [inventory_item.id])
+    await bump_data_version(db, [inventory_item.unit_id])
+    queue_inventory_event(db, inventory_item.unit_id, {"type": "upsert", "item": inventory_item.model_dump()})
     await db.commit()
     await db.refresh(inventory_item)
 
@@ -148,32 +367,13 @@ async def update_inventory_item(
 async def delete_inventory_item(
     item_id: int,
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user),
+    current_user: CurrentUser = Depends(get_current_user),
     unit_name: str = None  # Business unit name in the request
 ):
     """
     Endpoint to delete an inventory item.
     Admins can delete any inventory item, Employees can delete only inventory items assigned to their unit.
     """
-    # Verify the user's token
-    payload = verify_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-        )
-
-    # Get current user from the payload
-    statement = select(User).where(User.email == payload["sub"])
-    result = await db.execute(statement)
-    current_user = result.scalars().first()
-
-    if current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found",
-        )
-
     # Fetch the unit based on the unit name
     if unit_name:
         unit_statement = select(BusinessUnit).where(BusinessUnit.name == unit_name)
@@ -189,8 +389,8 @@ async def delete_inventory_item(
     else:
         unit_id = current_user.unit_id
 
-    # Fetch the inventory item by item_id
-    statement = select(Inventory).where(Inventory.id == item_id)
+    # Fetch and lock the inventory item by item_id, so was_low below cannot be stale
+    statement = select(Inventory).where(Inventory.id == item_id).with_for_update()
     result = await db.execute(statement)
     inventory_item = result.scalars().first()
 
@@ -218,68 +418,29 @@ async def delete_inventory_item(
         )
 
     # Delete the inventory item
+    was_low = is_low_stock(inventory_item.quantity, inventory_item.reorder_level)
+    await delete_inventory_notifications(db, inventory_item.id)
     await db.delete(inventory_item)
+    await adjust_inventory_unit_stats(db, {inventory_item.unit_id: (-1, -int(was_low))})
+    await bump_data_version(db, [inventory_item.unit_id])
+    queue_inventory_event(db, inventory_item.unit_id, {"type": "delete", "id": inventory_item.id})
     await db.commit()
+    invalidate_inventory_name_index(inventory_item.unit_id)
 
     return {"message": "Inventory item deleted successfully"}
 
 # Inventory stats route
 @router.get("/inventory-stats", response_model=dict)
 async def inventory_stats(
-    db: AsyncSession = Depends(get_session), token: str = Depends(oauth2_scheme_user)
+    db: AsyncSession = Depends(get_session), current_user: CurrentUser = Depends(get_token_user)
 ):
     """
     Endpoint to get inventory statistics, including:
-    - Total number of items with quantity < 10 (low inventory).
+    - Total number of items below their reorder level (low inventory).
     - Total number of inventory items.
+    - The same two counts per business unit.
+    Admins get stats for every unit, Employees only for their assigned unit.
     """
-    # Verify the user's token
-    payload = verify_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-        )
-
-    # Get current user from the payload
-    statement = select(User).where(User.email == payload["sub"])
-    result = await db.execute(statement)
-    current_user = result.scalars().first()
-
-    if current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found",
-        )
-
-    # Admin can view the stats for all inventory items
-    if current_user.role == "admin":
-        # Fetch total number of inventory items and low stock items
-        total_inventory_statement = select(Inventory)
-        low_inventory_statement = select(Inventory).where(Inventory.quantity < 10)
-
-        total_inventory_result = await db.execute(total_inventory_statement)
-        low_inventory_result = await db.execute(low_inventory_statement)
-
-        total_inventory_count = len(total_inventory_result.scalars().all())
-        low_inventory_count = len(low_inventory_result.scalars().all())
-
-    # Employees can view stats only for their assigned unit's inventory
-    elif current_user.role == "employee":
-        statement = select(Inventory).where(Inventory.unit_id == current_user.unit_id)
-        result = await db.execute(statement)
-        inventory_items = result.scalars().all()
-
-        total_inventory_count = len(inventory_items)
-        low_inventory_count = sum(1 for item in inventory_items if item.quantity < 10)
-
-    else:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Access denied: Invalid role",
-        )
+    unit_id = scope_inventory_unit(current_user, None)
 
-    return {
-        "total_inventory": total_inventory_count,
-        "low_inventory_count": low_inventory_count,
-    }
+    return await get_inventory_stats(db, unit_id)
@@ -1,20 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from db.session import get_session
+from db.session import get_session, AsyncSessionLocal
 from db.models import Notification, Inventory, User, BusinessUnit
 from sqlmodel import select
-from datetime import datetime
-from schemas.notification import NotificationCreate, NotificationResponse
+from sqlalchemy import func
+from schemas.notification import (
+    NotificationCreate,
+    NotificationResponse,
+    NotificationRecord,
+    NotificationPage,
+    NotificationBulkResolveRequest,
+    NotificationBulkResolveResponse,
+)
 from schemas.inventory import ReportLowInventoryRequest
-from utils.utils import verify_access_token, oauth2_scheme_user
+from schemas.auth import CurrentUser
+from utils.utils import get_current_user, get_token_user
+from utils.notifications import open_low_stock_notifications, resolve_notifications
+from utils.feed import notification_feed
+from core.config import settings
 from uuid import uuid4
-from typing import List
+from typing import List, Optional
+import asyncio
 
 router = APIRouter()
 
-# Threshold to consider low inventory
-LOW_INVENTORY_THRESHOLD = 10 
-
 # @router.post("/report-low-inventory")
 # async def report_low_inventory(
 #     data: ReportLowInventoryRequest,  # Use the Pydantic model
@@ -118,32 +128,14 @@ LOW_INVENTORY_THRESHOLD = 10
 async def report_low_inventory(
     data: ReportLowInventoryRequest,  # inventory_name is used in the request model
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user),
+    current_user: CurrentUser = Depends(get_current_user),
 ):
     """
     Endpoint for employees to report low inventory in their assigned unit.
     """
     print(f"Received inventory_name: {data.inventory_name}")
     
-    # Verify the user's token
-    payload = verify_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-        )
-
-    # Get current user from the payload
-    statement = select(User).where(User.email == payload["sub"])
-    result = await db.execute(statement)
-    current_user = result.scalars().first()
-
-    if current_user is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found",
-        )
-
+    # Check the user's role
     if current_user.role != "employee":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -168,24 +160,18 @@ async def report_low_inventory(
             detail="You can only report low inventory for items in your assigned unit",
         )
 
-    # Check if the inventory level is below the low inventory threshold
-    LOW_INVENTORY_THRESHOLD = 10
-    if inventory_item.quantity >= LOW_INVENTORY_THRESHOLD:
+    # Check if the inventory level is below the item's reorder level
+    if inventory_item.quantity >= inventory_item.reorder_level:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Inventory is not below the low inventory threshold ({LOW_INVENTORY_THRESHOLD})",
+            detail=f"Inventory is not below the reorder level ({inventory_item.reorder_level})",
         )
 
-    # Create a notification using the inventory_id
-    notification = Notification(
-        inventory_id=inventory_item.id,  # Link to the Inventory table via ID
-        message=f"Inventory for item '{inventory_item.name}' is below the reorder level. Current quantity: {inventory_item.quantity}",
-        resolved=False,
-        created_at=datetime.utcnow(),
+    # Open a notification unless the item already has an open one
+    await open_low_stock_notifications(
+        db, [(inventory_item.id, inventory_item.unit_id, inventory_item.name, inventory_item.quantity)]
     )
-    db.add(notification)
     await db.commit()
-    await db.refresh(notification)
 
     # Fetch the BusinessUnit and related details for reporting
     business_unit_statement = select(BusinessUnit).where(BusinessUnit.id == inventory_item.unit_id)
@@ -216,68 +202,274 @@ async def report_low_inventory(
 
 @router.get("/low-inventory", response_model=List[NotificationResponse])
 async def check_low_inventory(
+    unit_id: Optional[int] = None,
+    after_id: Optional[int] = Query(None, description="Return items with an inventory_id after this one"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user),
+    current_user: CurrentUser = Depends(get_token_user),
 ):
     """
-    Endpoint for admins to check for low inventory in all units.
+    Endpoint for admins to list open low-inventory notifications in all units.
+    Notifications are opened when stock drops below an item's reorder level (or
+    an employee reports it). They come with their item, business unit and the
+    unit's employee count from one query over the open-notification index.
+    Pass `limit` to page through the results, and the last inventory_id of a page
+    as `after_id` to get the next one.
     """
-    # Verify the user's token
-    payload = verify_access_token(token)
-    if payload is None:
+    # Check if the user is admin
+    if current_user.role != "admin":
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can check for low inventory",
         )
 
-    # Get current user from the payload
-    statement = select(User).where(User.email == payload["sub"])
-    result = await db.execute(statement)
-    current_user = result.scalars().first()
+    # Number of employees per unit
+    employee_counts = (
+        select(User.unit_id, func.count(User.id).label("total_employees"))
+        .where(User.unit_id.is_not(None))
+        .group_by(User.unit_id)
+        .subquery()
+    )
 
-    if current_user is None or current_user.role != "admin":
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Only admins can check for low inventory",
+    # Fetch open notifications with their item, business unit and employee count
+    statement = (
+        select(
+            Notification,
+            Inventory,
+            BusinessUnit.name,
+            BusinessUnit.location,
+            func.coalesce(employee_counts.c.total_employees, 0),
         )
+        .join(Inventory, Inventory.id == Notification.inventory_id)
+        .join(BusinessUnit, BusinessUnit.id == Inventory.unit_id)
+        .outerjoin(employee_counts, employee_counts.c.unit_id == Inventory.unit_id)
+        .where(Notification.resolved == False)
+    )
+    if unit_id is not None:
+        statement = statement.where(Inventory.unit_id == unit_id)
+    if after_id is not None:
+        statement = statement.where(Notification.inventory_id > after_id)
+    statement = statement.order_by(Notification.inventory_id)
+    if limit is not None:
+        statement = statement.limit(limit)
 
-    # Fetch all low inventory items
-    statement = select(Inventory).where(Inventory.quantity < LOW_INVENTORY_THRESHOLD)
     result = await db.execute(statement)
-    low_inventory_items = result.scalars().all()
-
-    notifications = []
-
-    for item in low_inventory_items:
-        # Fetch the associated business unit
-        business_unit_statement = select(BusinessUnit).where(BusinessUnit.id == item.unit_id)
-        result = await db.execute(business_unit_statement)
-        business_unit = result.scalars().first()
-
-        if not business_unit:
-            continue  # Skip if business unit is not found
-
-        # Fetch the number of employees in the unit
-        employee_count_statement = select(User).where(User.unit_id == item.unit_id)
-        result = await db.execute(employee_count_statement)
-        total_employees = len(result.scalars().all())
-
-        # Create notification object
-        notification = NotificationResponse(
-            id=item.id,  # Database will auto-generate this
-            inventory_id=item.id,
-            message=f"Low inventory for {item.name} in {business_unit.name}",
-            resolved=False,
-            created_at=datetime.utcnow(),
-            resolved_at=None,
-            business_unit_name=business_unit.name,
-            location=business_unit.location,
+
+    return [
+        NotificationResponse(
+            inventory_id=notification.inventory_id,
+            message=notification.message,
+            resolved=notification.resolved,
+            created_at=notification.created_at,
+            resolved_at=notification.resolved_at,
+            business_unit_name=unit_name,
+            location=location,
             total_employees=total_employees,
             inventory_item_name=item.name,
             price=item.price,
             quantity=item.quantity,
         )
+        for notification, item, unit_name, location, total_employees in result.all()
+    ]
+
+
+def scope_notification_unit(current_user: CurrentUser, unit_id: Optional[int]) -> Optional[int]:
+    """
+    Resolve which unit's notifications the caller may see or resolve: admins may
+    pick any unit (or none, for all units), employees only their assigned unit.
+    """
+    if current_user.role == "admin":
+        return unit_id
+    if current_user.role == "employee" and current_user.unit_id is not None:
+        if unit_id is not None and unit_id != current_user.unit_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You can only access notifications for your assigned unit",
+            )
+        return current_user.unit_id
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Only admins and unit employees can access notifications",
+    )
+
+
+@router.get("/history", response_model=NotificationPage)
+async def notification_history(
+    unit_id: Optional[int] = None,
+    resolved: Optional[bool] = None,
+    cursor: Optional[int] = Query(None, description="next_cursor of the previous page"),
+    limit: int = Query(50, ge=1, le=1000),
+    db: AsyncSession = Depends(get_session),
+    current_user: CurrentUser = Depends(get_token_user),
+):
+    """
+    Page through notifications, newest first. Admins see every unit (or `unit_id`),
+    Employees their assigned unit. Filter on `resolved` to list only open or only
+    resolved notifications. Archived notifications are not included.
+    """
+    unit_id = scope_notification_unit(current_user, unit_id)
+
+    statement = (
+        select(Notification, Inventory.unit_id, Inventory.name)
+        .join(Inventory, Inventory.id == Notification.inventory_id)
+    )
+    if unit_id is not None:
+        statement = statement.where(Inventory.unit_id == unit_id)
+    if resolved is not None:
+        statement = statement.where(Notification.resolved == resolved)
+
+    # Continue after the last row of the previous page
+    if cursor is not None:
+        statement = statement.where(Notification.id < cursor)
+
+    # Fetch one extra row to know whether another page exists
+    statement = statement.order_by(Notification.id.desc()).limit(limit + 1)
+    result = await db.execute(statement)
+    rows = result.all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1][0].id
+
+    return NotificationPage(
+        items=[
+            NotificationRecord(
+                id=notification.id,
+                inventory_id=notification.inventory_id,
+                unit_id=item_unit_id,
+                inventory_item_name=item_name,
+                message=notification.message,
+                resolved=notification.resolved,
+                created_at=notification.created_at,
+                resolved_at=notification.resolved_at,
+            )
+            for notification, item_unit_id, item_name in rows
+        ],
+        next_cursor=next_cursor,
+    )
+
+
+@router.post("/resolve", response_model=NotificationBulkResolveResponse)
+async def resolve_notifications_bulk(
+    data: NotificationBulkResolveRequest,
+    db: AsyncSession = Depends(get_session),
+    current_user: CurrentUser = Depends(get_token_user),
+):
+    """
+    Resolve many notifications with a single UPDATE. Admins may resolve any
+    notification, employees those of their assigned unit. Ids that are not found,
+    already resolved or outside the caller's unit are returned as `skipped`.
+    """
+    unit_id = scope_notification_unit(current_user, None)
+
+    notification_ids = list(dict.fromkeys(data.notification_ids))
+    if len(notification_ids) > settings.NOTIFICATION_BULK_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.NOTIFICATION_BULK_MAX_IDS} notifications can be resolved at once",
+        )
+
+    resolved = await resolve_notifications(db, notification_ids, unit_id)
+    await db.commit()
+
+    resolved_ids = set(resolved)
+    return NotificationBulkResolveResponse(
+        resolved=sorted(resolved_ids),
+        skipped=[notification_id for notification_id in notification_ids if notification_id not in resolved_ids],
+    )
 
-        notifications.append(notification)
 
-    return notifications
+@router.put("/{notification_id}/resolve")
+async def resolve_notification(
+    notification_id: int,
+    db: AsyncSession = Depends(get_session),
+    current_user: CurrentUser = Depends(get_token_user),
+):
+    """
+    Mark a low-inventory notification as resolved. Admins may resolve any
+    notification, employees those of their assigned unit.
+    """
+    statement = (
+        select(Notification, Inventory.unit_id)
+        .join(Inventory, Inventory.id == Notification.inventory_id)
+        .where(Notification.id == notification_id)
+    )
+    result = await db.execute(statement)
+    row = result.first()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Notification not found",
+        )
+    notification, unit_id = row
+
+    # Check if the user is admin or works in the item's unit
+    scope_notification_unit(current_user, unit_id)
+
+    if notification.resolved or not await resolve_notifications(db, [notification.id]):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Notification is already resolved",
+        )
+    await db.commit()
+
+    return {"message": "Notification resolved successfully", "id": notification.id}
+
+
+@router.get("/stream")
+async def notification_stream(
+    token: Optional[str] = Query(None),
+    unit_id: Optional[int] = None,
+    last_event_id: Optional[str] = Query(None),
+    authorization: Optional[str] = Header(None),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """
+    Server-Sent Events stream of notifications as they are opened or resolved:
+    - data: {"type": "opened" | "resolved", "unit_id", "notification": {...}}
+    - event: reload, when missed events are no longer buffered; refetch /low-inventory.
+    Admins follow every unit (or `unit_id`), Employees their assigned unit.
+    EventSource cannot set headers, so the access token may be passed as `token`.
+    Reconnecting clients send Last-Event-ID (or `last_event_id`) to receive the
+    events they missed from the replay buffer. Events are fanned out within one
+    process, so the app must run as a single worker.
+    """
+    if token is None and authorization and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    if token is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+        )
+
+    # Authorize with a short-lived session so no connection is held while subscribed
+    async with AsyncSessionLocal() as db:
+        current_user = await get_token_user(token, db)
+
+    unit_id = scope_notification_unit(current_user, unit_id)
+
+    # Subscribe and collect missed events together, so nothing falls in between
+    last_event_id = last_event_id_header or last_event_id
+    queue = notification_feed.subscribe(unit_id)
+    missed = notification_feed.replay(unit_id, last_event_id) if last_event_id else []
+
+    async def frames():
+        try:
+            for frame in missed:
+                yield frame
+            while True:
+                try:
+                    yield await asyncio.wait_for(
+                        queue.get(), timeout=settings.NOTIFICATION_KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            notification_feed.unsubscribe(unit_id, queue)
+
+    return StreamingResponse(
+        frames(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,11 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Request, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import tuple_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from sqlalchemy.future import select
 from db.session import get_session
-from db.models  import Order, OrderItem, Inventory, BusinessUnit, User
-from schemas.order import OrderCreate, OrderResponse, OrderItemCreate, OrderItemResponse
-from utils.utils import verify_access_token, oauth2_scheme_user
-from typing import List
+from core.config import settings
+from db.models  import Order, OrderItem, BusinessUnit
+from schemas.auth import CurrentUser
+from schemas.order import (
+    OrderCreate,
+    OrderResponse,
+    OrderItemCreate,
+    OrderItemResponse,
+    OrderPage,
+    OrderItemDetailResponse,
+    OrderDetailResponse,
+    OrderDetailPage,
+)
+from utils.utils import get_current_user, get_token_user, encode_cursor, decode_cursor, to_naive_utc
+from utils.data_version import check_data_version
+from utils.orders import create_order, order_writer, find_idempotent_order, idempotency_cache, stream_bulk_orders
+from utils.stock import run_in_transaction
+from typing import Optional
+from datetime import datetime
+import tempfile
 router = APIRouter()
 
 
@@ -13,31 +33,28 @@ router = APIRouter()
 async def place_order(
     order_create: OrderCreate,
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user),
+    current_user: CurrentUser = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key", max_length=255),
 ):
     """
     Endpoint for customers to place orders using inventory names.
     Inventory quantities are reduced for ordered items.
+    Retries carrying the same Idempotency-Key get the original order back
+    without touching inventory again.
     """
-    # Verify the user's token
-    payload = verify_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-        )
-
-    # Get the current user
-    statement = select(User).where(User.email == payload["sub"])
-    result = await db.execute(statement)
-    current_user = result.scalars().first()
-
-    if not current_user or current_user.role != "customer":
+    # Check the user's role
+    if current_user.role != "customer":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only customers can place orders.",
         )
 
+    # Replay the original response for a repeated Idempotency-Key
+    if idempotency_key:
+        existing_order = await find_idempotent_order(db, current_user.id, idempotency_key)
+        if existing_order is not None:
+            return existing_order
+
     # Fetch the business unit by name
     unit_statement = select(BusinessUnit).where(BusinessUnit.name == order_create.unit_name)
     unit_result = await db.execute(unit_statement)
@@ -49,107 +66,267 @@ async def place_order(
             detail="Business unit does not exist.",
         )
 
-    # Calculate total amount and validate inventory
-    total_amount = 0
-    for item in order_create.items:
-        # Fetch inventory by name and business unit
-        inventory_stmt = select(Inventory).where(
-            Inventory.name == item.inventory_name, Inventory.unit_id == business_unit.id
+    # Reserve stock and insert the order with its items in one transaction,
+    # retried if it loses a serialization race on a hot inventory row.
+    # Ids are captured up front because a rollback expires loaded instances.
+    user_id, unit_id = current_user.id, business_unit.id
+
+    if settings.ORDER_GROUP_COMMIT:
+        # Release this request's connection and let the writer batch the commit
+        await db.close()
+        return await order_writer.submit(user_id, unit_id, order_create, idempotency_key)
+
+    try:
+        order = await run_in_transaction(
+            db, lambda: create_order(db, user_id, unit_id, order_create, idempotency_key)
         )
-        inventory_result = await db.execute(inventory_stmt)
-        inventory_item = inventory_result.scalars().first()
+    except IntegrityError:
+        # A concurrent retry with the same Idempotency-Key committed first
+        existing_order = None
+        if idempotency_key:
+            existing_order = await find_idempotent_order(db, user_id, idempotency_key)
+        if existing_order is None:
+            raise
+        return existing_order
 
-        if not inventory_item:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Inventory item '{item.inventory_name}' does not exist in this business unit.",
-            )
-        if inventory_item.quantity < item.quantity:
+    if idempotency_key:
+        idempotency_cache.set((user_id, idempotency_key), OrderResponse.model_validate(order))
+
+    return order
+
+
+@router.post("/bulk")
+async def place_orders_bulk(
+    request: Request,
+    db: AsyncSession = Depends(get_session),
+    current_user: CurrentUser = Depends(get_current_user),
+):
+    """
+    Endpoint to import many orders at once (e.g. from an offline POS terminal).
+    The body is NDJSON, one OrderCreate per line. The response is NDJSON with one
+    result per input line: {"line", "status": "created", "order"} or
+    {"line", "status": "error", "detail"}.
+    """
+    # Check the user's role
+    if current_user.role != "customer":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only customers can place orders.",
+        )
+    user_id = current_user.id
+    await db.close()
+
+    # Spool the upload (to disk once it grows) before streaming results back,
+    # so memory stays flat however large the upload is
+    body = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    async for data in request.stream():
+        body.write(data)
+    body.seek(0)
+
+    async def results():
+        try:
+            async for line in stream_bulk_orders(body, user_id):
+                yield line
+        finally:
+            body.close()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+async def fetch_order_page(
+    db: AsyncSession,
+    current_user: CurrentUser,
+    cursor: Optional[str],
+    limit: int,
+    unit_id: Optional[int],
+    user_id: Optional[int],
+    order_type: Optional[str],
+    start: Optional[datetime],
+    end: Optional[datetime],
+    with_items: bool = False,
+):
+    """
+    Utility function shared by the order listings: scopes the caller, applies
+    the filters and the keyset cursor, and returns (orders, next_cursor).
+    With `with_items`, each order's items and their inventory rows are loaded by
+    one extra query for the whole page.
+    """
+    # Admins can view all orders
+    if current_user.role == "admin":
+        order_stmt = select(Order)
+    elif current_user.role == "employee":
+        # Employees can only view orders for their assigned unit
+        if unit_id is not None and unit_id != current_user.unit_id:
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Not enough stock for item '{inventory_item.name}'. Available: {inventory_item.quantity}",
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You can only view orders for your assigned unit.",
             )
+        unit_id = current_user.unit_id
+        order_stmt = select(Order)
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied.",
+        )
 
-        total_amount += item.quantity * inventory_item.price
-        # Deduct quantity
-        inventory_item.quantity -= item.quantity
-        db.add(inventory_item)
-
-    # Create the order
-    order = Order(
-        user_id=current_user.id,
-        unit_id=business_unit.id,
-        order_type=order_create.order_type,
-        total_amount=total_amount,
-    )
-    db.add(order)
-    await db.commit()
-    await db.refresh(order)
-
-    # Create order items
-    for item in order_create.items:
-        # Fetch inventory again for accurate pricing
-        inventory_stmt = select(Inventory).where(
-            Inventory.name == item.inventory_name, Inventory.unit_id == business_unit.id
+    # Apply filters
+    if unit_id is not None:
+        order_stmt = order_stmt.where(Order.unit_id == unit_id)
+    if user_id is not None:
+        order_stmt = order_stmt.where(Order.user_id == user_id)
+    if order_type is not None:
+        order_stmt = order_stmt.where(Order.order_type == order_type)
+    # created_at is naive UTC; comparing it with an aware value fails in asyncpg
+    if start is not None:
+        order_stmt = order_stmt.where(Order.created_at >= to_naive_utc(start))
+    if end is not None:
+        order_stmt = order_stmt.where(Order.created_at < to_naive_utc(end))
+
+    # Continue after the last row of the previous page
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        order_stmt = order_stmt.where(
+            tuple_(Order.created_at, Order.id) < tuple_(cursor_created_at, cursor_id)
         )
-        inventory_result = await db.execute(inventory_stmt)
-        inventory_item = inventory_result.scalars().first()
-
-        order_item = OrderItem(
-            order_id=order.id,
-            inventory_id=inventory_item.id,
-            quantity=item.quantity,
-            price=inventory_item.price,
+
+    if with_items:
+        order_stmt = order_stmt.options(
+            selectinload(Order.items).joinedload(OrderItem.inventory)
         )
-        db.add(order_item)
 
-    await db.commit()
+    # Fetch one extra row to know whether another page exists
+    order_stmt = order_stmt.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1)
+    orders_result = await db.execute(order_stmt)
+    orders = orders_result.scalars().all()
+
+    next_cursor = None
+    if len(orders) > limit:
+        orders = orders[:limit]
+        next_cursor = encode_cursor(orders[-1].created_at, orders[-1].id)
 
-    return order
+    return orders, next_cursor
+
+
+def to_order_detail(order: Order) -> OrderDetailResponse:
+    """
+    Build the detail response from an order whose items and inventory are loaded.
+    """
+    return OrderDetailResponse(
+        id=order.id,
+        user_id=order.user_id,
+        unit_id=order.unit_id,
+        order_type=order.order_type,
+        total_amount=order.total_amount,
+        created_at=order.created_at,
+        items=[
+            OrderItemDetailResponse(
+                id=item.id,
+                inventory_id=item.inventory_id,
+                inventory_name=item.inventory.name if item.inventory else None,
+                quantity=item.quantity,
+                price=item.price,
+            )
+            for item in order.items
+        ],
+    )
 
 
-@router.get("/list-orders", response_model=List[OrderResponse])
+@router.get("/list-orders", response_model=OrderPage, dependencies=[Depends(check_data_version)])
 async def get_orders(
     db: AsyncSession = Depends(get_session),
-    token: str = Depends(oauth2_scheme_user),
+    current_user: CurrentUser = Depends(get_token_user),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    unit_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    order_type: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
 ):
     """
-    Endpoint to retrieve orders:
+    Endpoint to retrieve orders, newest first, one page at a time:
     - Admins see all orders.
     - Employees see orders for their assigned business unit.
+    Pages are keyset-paginated on (created_at, id); pass `next_cursor` back as
+    `cursor` to fetch the next page. `start` is inclusive, `end` exclusive.
     """
-    # Verify the user's token
-    payload = verify_access_token(token)
-    if payload is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or expired token",
-        )
+    orders, next_cursor = await fetch_order_page(
+        db, current_user, cursor, limit, unit_id, user_id, order_type, start, end
+    )
+    return OrderPage(items=orders, next_cursor=next_cursor)
+
+
+@router.get("/list-orders-with-items", response_model=OrderDetailPage)
+async def get_orders_with_items(
+    db: AsyncSession = Depends(get_session),
+    current_user: CurrentUser = Depends(get_token_user),
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    unit_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    order_type: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    """
+    Endpoint to retrieve a page of orders together with their items and item names.
+    Same filters, access rules and cursor as /list-orders. The page is loaded with
+    a fixed number of queries whatever its size.
+    """
+    orders, next_cursor = await fetch_order_page(
+        db, current_user, cursor, limit, unit_id, user_id, order_type, start, end, with_items=True
+    )
+    return OrderDetailPage(
+        items=[to_order_detail(order) for order in orders], next_cursor=next_cursor
+    )
+
 
-    # Get the current user
-    statement = select(User).where(User.email == payload["sub"])
-    result = await db.execute(statement)
-    current_user = result.scalars().first()
+@router.get("/{order_id}", response_model=OrderDetailResponse)
+async def get_order(
+    order_id: int,
+    db: AsyncSession = Depends(get_session),
+    current_user: CurrentUser = Depends(get_token_user),
+):
+    """
+    Endpoint to retrieve a single order with its items and item names:
+    - Admins can view any order.
+    - Employees can view orders for their assigned business unit.
+    - Customers can view their own orders.
+    """
+    # Fetch the order with its items and inventory rows
+    order_stmt = (
+        select(Order)
+        .where(Order.id == order_id)
+        .options(selectinload(Order.items).joinedload(OrderItem.inventory))
+    )
+    order_result = await db.execute(order_stmt)
+    order = order_result.scalars().first()
 
-    if not current_user:
+    if order is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found.",
+            detail="Order not found.",
         )
 
-    # Admins can view all orders
+    # Check if the current user is allowed to view this order
     if current_user.role == "admin":
-        order_stmt = select(Order)
+        pass
     elif current_user.role == "employee":
-        # Employees can only view orders for their assigned unit
-        order_stmt = select(Order).where(Order.unit_id == current_user.unit_id)
+        if order.unit_id != current_user.unit_id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You can only view orders for your assigned unit.",
+            )
+    elif current_user.role == "customer":
+        if order.user_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You can only view your own orders.",
+            )
     else:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied.",
         )
 
-    orders_result = await db.execute(order_stmt)
-    orders = orders_result.scalars().all()
-
-    return orders
+    return to_order_detail(order)
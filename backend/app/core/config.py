@@ -18,6 +18,80 @@ class Settings(BaseSettings):
     ADMIN_EMAIL: str
     ADMIN_PASSWORD: str
 
+    # bcrypt runs on a bounded pool: "thread" or "process"
+    PASSWORD_HASH_EXECUTOR: str = "thread"
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_QUEUE: int = 256
+
+    # Cache of resolved users for the get_current_user dependency
+    USER_CACHE_SIZE: int = 4096
+    USER_CACHE_TTL_SECONDS: int = 60
+
+    # Rows fetched per round trip when streaming the inventory listing
+    INVENTORY_STREAM_CHUNK_SIZE: int = 1000
+
+    # CSV inventory import: rows validated and copied per chunk, errors reported
+    INVENTORY_IMPORT_CHUNK_SIZE: int = 10000
+    INVENTORY_IMPORT_MAX_ERRORS: int = 100
+
+    # Largest accepted batch inventory update
+    INVENTORY_BATCH_MAX_ITEMS: int = 1000
+
+    # In-process per-unit item name index for autocomplete
+    INVENTORY_NAME_INDEX_UNITS: int = 1024
+    INVENTORY_NAME_INDEX_TTL_SECONDS: int = 300
+
+    # Buffered inventory change events per feed subscriber. The feeds fan out
+    # within one process, so run a single worker when they are used
+    INVENTORY_FEED_QUEUE_SIZE: int = 256
+
+    # Notification stream: buffered events per subscriber, events kept for
+    # Last-Event-ID replay, keep-alive interval. Like the inventory feed, the
+    # stream and its replay buffer only cover the current worker
+    NOTIFICATION_FEED_QUEUE_SIZE: int = 256
+    NOTIFICATION_REPLAY_SIZE: int = 1000
+    NOTIFICATION_KEEPALIVE_SECONDS: int = 15
+
+    # Notification history, bulk resolve and archiving of old resolved notifications
+    NOTIFICATION_BULK_MAX_IDS: int = 1000
+    NOTIFICATION_RETENTION_DAYS: int = 30
+    NOTIFICATION_ARCHIVE_INTERVAL_SECONDS: int = 3600
+    NOTIFICATION_ARCHIVE_BATCH_SIZE: int = 5000
+
+    # Most buckets returned by the sales time-series report
+    SALES_TIMESERIES_MAX_BUCKETS: int = 1000
+
+    # Keep per-unit inventory counters for the stats endpoint
+    INVENTORY_STATS_COUNTERS: bool = False
+
+    # Largest accepted bulk employee upload
+    EMPLOYEE_BULK_MAX_ROWS: int = 1000
+
+    # Rotating refresh tokens
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    REFRESH_TOKEN_PURGE_INTERVAL_SECONDS: int = 3600
+
+    # Per-user access token versions, used to revoke tokens
+    TOKEN_VERSION_CACHE_SIZE: int = 65536
+    TOKEN_VERSION_TTL_SECONDS: int = 60
+
+    # Stock reservation: bounded retries on serialization failure / deadlock
+    STOCK_RETRY_ATTEMPTS: int = 3
+    STOCK_RETRY_BACKOFF_MS: int = 10
+
+    # Group commit for /orders/place-order (opt-in write-behind queue)
+    ORDER_GROUP_COMMIT: bool = False
+    ORDER_BATCH_SIZE: int = 32
+    ORDER_BATCH_LINGER_MS: int = 5
+
+    # /orders/bulk: records placed per transaction
+    ORDER_BULK_CHUNK_SIZE: int = 500
+
+    # Idempotency-Key handling for /orders/place-order
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_KEY_TTL_SECONDS: int = 86400
+    IDEMPOTENCY_PURGE_INTERVAL_SECONDS: int = 3600
+
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
 
@@ -1,4 +1,6 @@
 # In init_db.py
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
 from .session import engine
 from .models import SQLModel
 
@@ -7,3 +9,90 @@ async def init_db():
         # This will drop all tables and recreate them
         #await conn.run_sync(SQLModel.metadata.drop_all)
         await conn.run_sync(SQLModel.metadata.create_all)  # Ensure tables are created
+
+        # Columns and indexes added to tables that existing databases already have;
+        # create_all only creates missing tables
+        await conn.execute(text(
+            'ALTER TABLE "user" ADD COLUMN IF NOT EXISTS token_version INTEGER NOT NULL DEFAULT 0'
+        ))
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_inventory_unit_id_id ON inventory (unit_id, id)"
+        ))
+
+        # Item names are unique per unit; older databases may hold duplicates, which
+        # keep their name on the lowest id and get " #<id>" appended otherwise
+        result = await conn.execute(text(
+            "SELECT 1 FROM pg_constraint WHERE conname = 'uq_inventory_unit_id_name'"
+        ))
+        if result.first() is None:
+            result = await conn.execute(text(
+                "UPDATE inventory SET name = left(name, 100 - length(' #' || id)) || ' #' || id "
+                "WHERE id NOT IN (SELECT min(id) FROM inventory GROUP BY unit_id, name) "
+                "RETURNING id, name"
+            ))
+            for inventory_id, name in result.all():
+                print(f"Renamed duplicate inventory item {inventory_id} to '{name}'")
+            await conn.execute(text(
+                "ALTER TABLE inventory ADD CONSTRAINT uq_inventory_unit_id_name UNIQUE (unit_id, name)"
+            ))
+
+        await conn.execute(text(
+            'ALTER TABLE "order" ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(255)'
+        ))
+        await conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_order_user_idempotency_key "
+            'ON "order" (user_id, idempotency_key)'
+        ))
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_order_idempotency_created_at "
+            'ON "order" (created_at) WHERE idempotency_key IS NOT NULL'
+        ))
+        await conn.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_order_unit_created_at_id ON "order" (unit_id, created_at, id)'
+        ))
+        await conn.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_order_created_at_id ON "order" (created_at, id)'
+        ))
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_orderitem_order_id ON orderitem (order_id)"
+        ))
+        await conn.execute(text(
+            "ALTER TABLE notification ADD COLUMN IF NOT EXISTS resolved_at TIMESTAMP WITHOUT TIME ZONE"
+        ))
+
+        # At most one open notification per item; older databases may hold several,
+        # of which all but the newest are resolved first
+        result = await conn.execute(text("SELECT to_regclass('uq_notification_open_inventory_id')"))
+        if result.scalar() is None:
+            await conn.execute(text(
+                "UPDATE notification SET resolved = true, resolved_at = now() AT TIME ZONE 'utc' "
+                "WHERE resolved = false AND id NOT IN "
+                "(SELECT max(id) FROM notification WHERE resolved = false GROUP BY inventory_id)"
+            ))
+            await conn.execute(text(
+                "CREATE UNIQUE INDEX uq_notification_open_inventory_id "
+                "ON notification (inventory_id) WHERE resolved = false"
+            ))
+
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_notification_resolved_at "
+            "ON notification (resolved_at) WHERE resolved = true"
+        ))
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_dailyunitsales_day ON dailyunitsales (day)"
+        ))
+
+    # Trigram indexes for inventory search; needs the pg_trgm extension (postgres contrib)
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_inventory_name_trgm "
+                "ON inventory USING gin (name gin_trgm_ops)"
+            ))
+            await conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_inventory_description_trgm "
+                "ON inventory USING gin (description gin_trgm_ops)"
+            ))
+    except DBAPIError as e:
+        print(f"pg_trgm is not available, inventory search will not be indexed: {e}")
@@ -1,7 +1,8 @@
 # models.py
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import Index, UniqueConstraint, text
 from typing import Optional, List
-from datetime import datetime
+from datetime import date, datetime
 
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -13,6 +14,18 @@ class User(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     business_unit: Optional["BusinessUnit"] = Relationship(back_populates="employees")
     password_hash: str = Field(nullable=False, max_length=255)
+    token_version: int = Field(
+        default=0, nullable=False, sa_column_kwargs={"server_default": "0"}
+    )  # Bumped to revoke issued tokens
+
+
+class RefreshToken(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="user.id", index=True)
+    token_hash: str = Field(nullable=False, max_length=64, unique=True)  # SHA-256 hex digest
+    expires_at: datetime = Field(nullable=False, index=True)
+    revoked: bool = Field(default=False)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
 class BusinessUnit(SQLModel, table=True):
@@ -24,6 +37,13 @@ class BusinessUnit(SQLModel, table=True):
 
 
 class Inventory(SQLModel, table=True):
+    __table_args__ = (
+        # Serves per-unit listings and their id keyset pagination
+        Index("ix_inventory_unit_id_id", "unit_id", "id"),
+        # Item names are unique per unit; bulk imports upsert on this
+        UniqueConstraint("unit_id", "name", name="uq_inventory_unit_id_name"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     unit_id: int = Field(foreign_key="businessunit.id", nullable=False)
     name: str = Field(nullable=False, max_length=100)  # Max length 100
@@ -33,20 +53,75 @@ class Inventory(SQLModel, table=True):
     price: float = Field(nullable=False)
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+# Per-unit inventory counters, kept in step with inventory writes when
+# INVENTORY_STATS_COUNTERS is enabled
+class InventoryUnitStats(SQLModel, table=True):
+    unit_id: int = Field(foreign_key="businessunit.id", primary_key=True)
+    total_count: int = Field(default=0, nullable=False)
+    low_count: int = Field(default=0, nullable=False)  # Items below their reorder level
+
+# Per-unit data version, bumped by every inventory, order and feedback write
+# of the unit; served as the ETag of the unit's listings and reports
+class UnitDataVersion(SQLModel, table=True):
+    unit_id: int = Field(foreign_key="businessunit.id", primary_key=True)
+    version: int = Field(default=0, nullable=False)
+
 class Order(SQLModel, table=True):
+    __table_args__ = (
+        # One order per client-supplied Idempotency-Key and user
+        Index("ix_order_user_idempotency_key", "user_id", "idempotency_key", unique=True),
+        # Lets the TTL purge find live keys without scanning every order
+        Index(
+            "ix_order_idempotency_created_at",
+            "created_at",
+            postgresql_where=text("idempotency_key IS NOT NULL"),
+        ),
+        # Keyset pagination of order listings, per unit and across all units
+        Index("ix_order_unit_created_at_id", "unit_id", "created_at", "id"),
+        Index("ix_order_created_at_id", "created_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: Optional[int] = Field(foreign_key="user.id")
     unit_id: int = Field(foreign_key="businessunit.id")
     order_type: str = Field(nullable=False, max_length=20)  # Max length 20
     total_amount: float = Field(nullable=False)
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    idempotency_key: Optional[str] = Field(default=None, max_length=255)  # Cleared once expired
+    items: List["OrderItem"] = Relationship(
+        back_populates="order", sa_relationship_kwargs={"order_by": "OrderItem.id"}
+    )
 
 class OrderItem(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    order_id: int = Field(foreign_key="order.id")
+    order_id: int = Field(foreign_key="order.id", index=True)
     inventory_id: int = Field(foreign_key="inventory.id")
     quantity: int = Field(nullable=False)
     price: float = Field(nullable=False)
+    order: Optional[Order] = Relationship(back_populates="items")
+    inventory: Optional[Inventory] = Relationship()
+
+# Daily sales rollups, updated by order placement in the order's transaction;
+# the financial reports read these instead of the order history
+class DailyUnitSales(SQLModel, table=True):
+    unit_id: int = Field(foreign_key="businessunit.id", primary_key=True)
+    day: date = Field(primary_key=True, index=True)  # Date ranges across every unit
+    order_count: int = Field(default=0, nullable=False)
+    total_sales: float = Field(default=0, nullable=False)
+
+class DailyItemSales(SQLModel, table=True):
+    unit_id: int = Field(foreign_key="businessunit.id", primary_key=True)
+    day: date = Field(primary_key=True)
+    inventory_id: int = Field(foreign_key="inventory.id", primary_key=True)
+    quantity: int = Field(default=0, nullable=False)
+    revenue: float = Field(default=0, nullable=False)
+
+class DailyCustomerSales(SQLModel, table=True):
+    unit_id: int = Field(foreign_key="businessunit.id", primary_key=True)
+    day: date = Field(primary_key=True)
+    user_id: int = Field(foreign_key="user.id", primary_key=True)
+    order_count: int = Field(default=0, nullable=False)
+    total_spent: float = Field(default=0, nullable=False)
 
 class Feedback(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -66,8 +141,37 @@ class FinancialReport(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class Notification(SQLModel, table=True):
+    __table_args__ = (
+        # At most one open notification per item; also serves the open-notification listing
+        Index(
+            "uq_notification_open_inventory_id",
+            "inventory_id",
+            unique=True,
+            postgresql_where=text("resolved = false"),
+        ),
+        # Resolved notifications by age, for the archive job
+        Index(
+            "ix_notification_resolved_at",
+            "resolved_at",
+            postgresql_where=text("resolved = true"),
+        ),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     inventory_id: int = Field(foreign_key="inventory.id")
     message: str = Field(max_length=255)
     resolved: bool = Field(default=False)
     created_at: datetime = Field(default_factory=datetime.utcnow)  # Ensure the default is set correctly
+    resolved_at: Optional[datetime] = None
+
+# Resolved notifications moved out of the notification table after the retention period
+class NotificationArchive(SQLModel, table=True):
+    __tablename__ = "notification_archive"
+
+    id: int = Field(primary_key=True, sa_column_kwargs={"autoincrement": False})
+    inventory_id: int = Field(index=True)  # No foreign key, archived rows outlive their item
+    message: str = Field(max_length=255)
+    resolved: bool = Field(default=True)
+    created_at: datetime
+    resolved_at: Optional[datetime] = None
+    archived_at: datetime = Field(default_factory=datetime.utcnow)
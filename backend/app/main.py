@@ -9,6 +9,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from db.models import User
 from datetime import datetime
 from db.session import AsyncSessionLocal
+from utils.orders import order_writer, purge_expired_idempotency_keys
+from utils.utils import password_hasher, purge_expired_refresh_tokens
+from utils.inventory import rebuild_inventory_unit_stats
+from utils.notifications import archive_resolved_notifications, sync_low_stock_notifications
+from utils.sales import rebuild_sales_rollups, sales_rollups_missing
+import asyncio
 from api.endpoints import (
     auth,
     inventory,
@@ -62,6 +68,19 @@ async def create_admin_user(db: AsyncSession) -> bool:
         return False
 
 
+async def run_periodically(interval_seconds: int, job) -> None:
+    """
+    Run a maintenance job with its own session every `interval_seconds`.
+    """
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            async with AsyncSessionLocal() as db:
+                await job(db)
+        except Exception as e:
+            print(f"Error running {job.__name__}: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
@@ -80,9 +99,54 @@ async def lifespan(app: FastAPI):
         else:
             print("Admin user already exists.")
 
+        # Rebuild the per-unit inventory counters, which may have missed writes
+        # made while they were disabled
+        if settings.INVENTORY_STATS_COUNTERS:
+            await rebuild_inventory_unit_stats(db)
+            await db.commit()
+
+        # Open notifications for items already below their reorder level, e.g. on
+        # first start after notifications began tracking stock
+        await sync_low_stock_notifications(db)
+        await db.commit()
+
+        # Backfill the daily sales rollups on first start with existing orders
+        if await sales_rollups_missing(db):
+            await rebuild_sales_rollups(db)
+            print("Sales rollups backfilled.")
+        await db.commit()
+
+        # Start the group-commit writer for order placement
+        if settings.ORDER_GROUP_COMMIT:
+            order_writer.start()
+
+        # Periodically drop expired Idempotency-Keys and refresh tokens, and archive
+        # old resolved notifications
+        maintenance_tasks = [
+            asyncio.create_task(
+                run_periodically(
+                    settings.IDEMPOTENCY_PURGE_INTERVAL_SECONDS, purge_expired_idempotency_keys
+                )
+            ),
+            asyncio.create_task(
+                run_periodically(
+                    settings.REFRESH_TOKEN_PURGE_INTERVAL_SECONDS, purge_expired_refresh_tokens
+                )
+            ),
+            asyncio.create_task(
+                run_periodically(
+                    settings.NOTIFICATION_ARCHIVE_INTERVAL_SECONDS, archive_resolved_notifications
+                )
+            ),
+        ]
+
         yield
 
-    # Shutdown logic (if needed)
+    # Shutdown logic
+    for task in maintenance_tasks:
+        task.cancel()
+    await order_writer.stop()
+    password_hasher.shutdown()
     print("Application shutting down")
 
 
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class UserCreate(BaseModel):
@@ -27,9 +27,36 @@ class UserResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class EmployeeBulkError(BaseModel):
+    row: int
+    email: Optional[str] = None
+    detail: str
+
+class EmployeeBulkResult(BaseModel):
+    created: List[UserResponse]
+    errors: List[EmployeeBulkError]
+
+# The authenticated caller, as resolved (and cached) from the access token
+class CurrentUser(BaseModel):
+    id: int
+    name: Optional[str] = None  # Not carried in token claims
+    email: str
+    role: str
+    gender: Optional[str] = None
+    unit_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+        frozen = True
+
 class Token(BaseModel):
     access_token: str  # Fixed typo in the token field
     token_type: str
+    refresh_token: Optional[str] = None
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 
 # Define the Pydantic model for the User
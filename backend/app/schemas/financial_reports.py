@@ -5,9 +5,20 @@ from datetime import date
 
 class SalesReportSchema(BaseModel):
     total_sales: float
-    total_expenses: float
-    profit: float
-    report_date: date
+    order_count: int
+
+
+class MonthlySalesReportSchema(BaseModel):
+    year: int
+    month: int
+    total_sales: float
+    order_count: int
+
+
+class SalesTimeSeriesPointSchema(BaseModel):
+    period_start: date  # First day of the day, week (Monday) or month
+    total_sales: float
+    order_count: int
 
 
 class InventoryValuationSchema(BaseModel):
@@ -21,6 +21,11 @@ class InventoryUpdate(BaseModel):
     price: Optional[float] = Field(None, ge=0, description="Updated price per unit")
 
 
+# Schema for one item of a batch inventory update
+class InventoryBatchUpdate(InventoryUpdate):
+    id: int = Field(..., description="ID of the inventory item to update")
+
+
 # Schema for viewing inventory items
 class InventoryResponse(InventoryCreate):
     id: int = Field(..., description="ID of the inventory item")
@@ -2,7 +2,7 @@
 
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 class NotificationCreate(BaseModel):
     inventory_id: int
@@ -24,3 +24,24 @@ class NotificationResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+class NotificationRecord(BaseModel):
+    id: int
+    inventory_id: int
+    unit_id: int
+    inventory_item_name: str
+    message: str
+    resolved: bool
+    created_at: datetime
+    resolved_at: Optional[datetime]
+
+class NotificationPage(BaseModel):
+    items: List[NotificationRecord]
+    next_cursor: Optional[int] = None  # Pass back as `cursor` to get the next page
+
+class NotificationBulkResolveRequest(BaseModel):
+    notification_ids: List[int]
+
+class NotificationBulkResolveResponse(BaseModel):
+    resolved: List[int]
+    skipped: List[int]  # Not found, already resolved or outside the caller's unit
@@ -6,7 +6,7 @@ from datetime import datetime
 # Schema for creating an OrderItem
 class OrderItemCreate(BaseModel):
     inventory_name: str
-    quantity: int
+    quantity: int = Field(..., gt=0, le=2**31 - 1)  # Inventory.quantity is a 32-bit integer
 
 
 # Schema for creating an Order
@@ -29,6 +29,12 @@ class OrderResponse(BaseModel):
         from_attributes = True
 
 
+# Schema for one page of a keyset-paginated order listing
+class OrderPage(BaseModel):
+    items: List[OrderResponse]
+    next_cursor: Optional[str] = None  # Pass back as `cursor` to get the next page
+
+
 # Schema for an OrderItem response
 class OrderItemResponse(BaseModel):
     id: int
@@ -39,3 +45,23 @@ class OrderItemResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+# Schema for an OrderItem together with its inventory item's name
+class OrderItemDetailResponse(BaseModel):
+    id: int
+    inventory_id: int
+    inventory_name: Optional[str]
+    quantity: int
+    price: float
+
+
+# Schema for an Order together with its items
+class OrderDetailResponse(OrderResponse):
+    items: List[OrderItemDetailResponse]
+
+
+# Schema for one page of orders with their items
+class OrderDetailPage(BaseModel):
+    items: List[OrderDetailResponse]
+    next_cursor: Optional[str] = None
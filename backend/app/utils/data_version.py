@@ -0,0 +1,75 @@
+from fastapi import Depends, HTTPException, Request, Response, status
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+from db.models import UnitDataVersion
+from db.session import get_session
+from schemas.auth import CurrentUser
+from utils.utils import get_token_user
+from typing import Iterable, Optional
+import hashlib
+
+
+async def bump_data_version(db: AsyncSession, unit_ids: Iterable[int]) -> None:
+    """
+    Increment the data version of every given unit in the caller's transaction.
+    Call it as the last statement before the commit: it locks the units' version
+    rows until then.
+    """
+    rows = [{"unit_id": unit_id, "version": 1} for unit_id in sorted(set(unit_ids))]
+    if not rows:
+        return
+
+    statement = insert(UnitDataVersion).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[UnitDataVersion.unit_id],
+        set_={"version": UnitDataVersion.version + 1},
+    )
+    await db.execute(statement)
+
+
+async def get_data_version(db: AsyncSession, unit_id: Optional[int]) -> int:
+    """
+    Return the unit's data version, or with `unit_id` None a version that changes
+    whenever any unit's does (the sum of all of them).
+    """
+    if unit_id is None:
+        statement = select(func.coalesce(func.sum(UnitDataVersion.version), 0))
+    else:
+        statement = select(UnitDataVersion.version).where(UnitDataVersion.unit_id == unit_id)
+    result = await db.execute(statement)
+    return result.scalar() or 0
+
+
+async def check_data_version(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_session),
+    current_user: CurrentUser = Depends(get_token_user),
+) -> None:
+    """
+    Dependency for read endpoints scoped by unit. Sets an ETag built from the
+    caller's unit data version (all units for admins), the caller's scope and the
+    query string, and answers 304 before the endpoint runs when the client's
+    If-None-Match already carries it.
+    """
+    if current_user.role == "admin":
+        unit_id = None
+    elif current_user.role == "employee" and current_user.unit_id is not None:
+        unit_id = current_user.unit_id
+    else:
+        # Let the endpoint reject the caller
+        return
+
+    version = await get_data_version(db, unit_id)
+    variant = f"{request.url.path}?{request.url.query}|{current_user.role}|{unit_id}"
+    etag = f'W/"{version}-{hashlib.sha1(variant.encode()).hexdigest()[:16]}"'
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = {candidate.strip() for candidate in if_none_match.split(",")}
+        if etag in candidates or "*" in candidates:
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    response.headers["ETag"] = etag
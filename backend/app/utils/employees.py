@@ -0,0 +1,108 @@
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+from db.models import User, BusinessUnit
+from schemas.auth import UserCreate
+from utils.utils import hash_passwords_async
+from datetime import datetime
+from typing import Any, Dict, List, Tuple, Union
+import csv
+import io
+import json
+
+
+def parse_employee_rows(body: bytes, content_type: str) -> List[Tuple[int, Union[UserCreate, str]]]:
+    """
+    Parse a bulk employee upload: a JSON array of UserCreate objects, or CSV with a
+    header row (name,email,password,gender,unit_id).
+
+    Returns (row number, UserCreate or validation error) per record, rows counted from 1.
+    """
+    if "csv" in content_type:
+        reader = csv.DictReader(io.StringIO(body.decode("utf-8-sig")))
+        raw_rows: List[Any] = [
+            {key: value for key, value in row.items() if value not in (None, "")}
+            for row in reader
+        ]
+    else:
+        raw_rows = json.loads(body)
+        if not isinstance(raw_rows, list):
+            raise ValueError("Expected a JSON array of employees.")
+
+    rows: List[Tuple[int, Union[UserCreate, str]]] = []
+    for number, raw_row in enumerate(raw_rows, start=1):
+        try:
+            rows.append((number, UserCreate.model_validate(raw_row)))
+        except ValidationError as error:
+            rows.append((number, str(error)))
+    return rows
+
+
+async def create_employees_bulk(
+    db: AsyncSession, rows: List[Tuple[int, Union[UserCreate, str]]]
+) -> Tuple[List[User], List[Dict[str, Any]]]:
+    """
+    Create employees for every valid row with a fixed number of statements.
+
+    Email uniqueness and business units are checked for the whole batch with one
+    query each, passwords are hashed in parallel on the password hasher pool with
+    no connection held, and the accepted users are inserted together. Rows that cannot be created are
+    reported as {"row", "email", "detail"} without affecting the others.
+    The session is closed before hashing and reopened for the insert, which is
+    not committed here.
+    """
+    candidates = [(number, entry) for number, entry in rows if isinstance(entry, UserCreate)]
+    errors = [
+        {"row": number, "email": None, "detail": entry}
+        for number, entry in rows
+        if not isinstance(entry, UserCreate)
+    ]
+
+    # Check emails and business units for the whole batch at once
+    emails = {entry.email for _, entry in candidates}
+    existing_emails = set()
+    if emails:
+        result = await db.execute(select(User.email).where(User.email.in_(emails)))
+        existing_emails = set(result.scalars().all())
+
+    unit_ids = {entry.unit_id for _, entry in candidates if entry.unit_id}
+    existing_units = set()
+    if unit_ids:
+        result = await db.execute(select(BusinessUnit.id).where(BusinessUnit.id.in_(unit_ids)))
+        existing_units = set(result.scalars().all())
+
+    accepted: List[Tuple[int, UserCreate]] = []
+    seen_emails = set()
+    for number, entry in candidates:
+        if entry.email in existing_emails or entry.email in seen_emails:
+            errors.append({"row": number, "email": entry.email, "detail": "Email already exists"})
+        elif entry.unit_id and entry.unit_id not in existing_units:
+            errors.append({"row": number, "email": entry.email, "detail": "Business unit not found"})
+        else:
+            seen_emails.add(entry.email)
+            accepted.append((number, entry))
+
+    # Release the connection while the passwords wait for the hashing pool; the
+    # insert below opens a new transaction, and the unique email index still
+    # guards against a concurrent insert of the same address
+    await db.close()
+    password_hashes = await hash_passwords_async([entry.password for _, entry in accepted])
+
+    created_at = datetime.now()
+    employees = [
+        User(
+            name=entry.name,
+            email=entry.email,
+            role="employee",
+            gender=entry.gender,
+            unit_id=entry.unit_id,
+            created_at=created_at,
+            password_hash=password_hash,
+        )
+        for (_, entry), password_hash in zip(accepted, password_hashes)
+    ]
+    db.add_all(employees)
+    await db.flush()
+
+    errors.sort(key=lambda error: error["row"])
+    return employees, errors
@@ -0,0 +1,174 @@
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, SessionTransaction
+from core.config import settings
+from collections import deque
+from typing import Any, Dict, List, Optional, Set
+import asyncio
+import json
+import uuid
+
+RELOAD_EVENT = json.dumps({"type": "reload"})
+
+
+class InventoryFeed:
+    """
+    In-process fan-out of inventory change events to per-unit subscribers.
+
+    Each subscriber owns a bounded queue. An event is serialized once and handed to
+    every matching queue without awaiting, so publishing costs no database work and
+    never blocks on a slow client. A subscriber whose queue is full has its backlog
+    replaced by a single "reload" event, telling it to refetch the inventory.
+
+    Subscribers only see events published by their own process: with several
+    uvicorn workers, writes handled by another worker never reach them. The feeds
+    therefore require a single worker.
+    """
+
+    reload_message = RELOAD_EVENT
+
+    def __init__(self, queue_size: int):
+        self.queue_size = max(queue_size, 1)
+        self.published = 0
+        self.overflows = 0
+        # Subscribers keyed on unit id; None subscribes to every unit
+        self._subscribers: Dict[Optional[int], Set[asyncio.Queue]] = {}
+
+    def subscribe(self, unit_id: Optional[int]) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(unit_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, unit_id: Optional[int], queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(unit_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[unit_id]
+
+    def publish(self, unit_id: int, payload: Dict[str, Any]) -> None:
+        self._fan_out(unit_id, json.dumps({"unit_id": unit_id, **payload}, default=str))
+
+    def _fan_out(self, unit_id: int, message: str) -> None:
+        self.published += 1
+        for key in (unit_id, None):
+            for queue in self._subscribers.get(key, ()):
+                try:
+                    queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    self.overflows += 1
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait(self.reload_message)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            "published": self.published,
+            "overflows": self.overflows,
+        }
+
+
+class NotificationFeed(InventoryFeed):
+    """
+    Fan-out of notification events as Server-Sent Events frames.
+
+    Every event gets an id of the form "<process epoch>-<sequence>" and is kept in a
+    bounded replay buffer, so a client reconnecting with Last-Event-ID receives what
+    it missed without re-querying. When the id is older than the buffer, or was
+    issued by another process, the client is told to reload instead. A client that
+    reconnects to another worker therefore reloads, but events published by other
+    workers never reach it; like the inventory feed, this needs a single worker.
+    """
+
+    reload_message = 'event: reload\ndata: {"type": "reload"}\n\n'
+
+    def __init__(self, queue_size: int, replay_size: int):
+        super().__init__(queue_size)
+        self.epoch = uuid.uuid4().hex[:8]
+        self.sequence = 0
+        self._replay: deque = deque(maxlen=max(replay_size, 1))
+
+    def publish(self, unit_id: int, payload: Dict[str, Any]) -> None:
+        self.sequence += 1
+        data = json.dumps({"unit_id": unit_id, **payload}, default=str)
+        frame = f"id: {self.epoch}-{self.sequence}\ndata: {data}\n\n"
+        self._replay.append((self.sequence, unit_id, frame))
+        self._fan_out(unit_id, frame)
+
+    def replay(self, unit_id: Optional[int], last_event_id: str) -> List[str]:
+        """
+        Return the frames for `unit_id` (every unit if None) published after
+        `last_event_id`, or a single reload frame when they are no longer buffered.
+        """
+        epoch, _, sequence = last_event_id.partition("-")
+        if epoch != self.epoch or not sequence.isdigit():
+            return [self.reload_message]
+
+        last_sequence = int(sequence)
+        oldest_kept = self._replay[0][0] if self._replay else self.sequence + 1
+        if last_sequence + 1 < oldest_kept:
+            return [self.reload_message]
+
+        return [
+            frame
+            for event_sequence, event_unit_id, frame in self._replay
+            if event_sequence > last_sequence and unit_id in (None, event_unit_id)
+        ]
+
+
+inventory_feed = InventoryFeed(settings.INVENTORY_FEED_QUEUE_SIZE)
+notification_feed = NotificationFeed(
+    settings.NOTIFICATION_FEED_QUEUE_SIZE, settings.NOTIFICATION_REPLAY_SIZE
+)
+
+
+def queue_feed_event(
+    db: AsyncSession, feed: InventoryFeed, unit_id: int, payload: Dict[str, Any]
+) -> None:
+    """
+    Record an event to publish on `feed` once the session's transaction commits.
+    Events recorded inside a SAVEPOINT that rolls back, or in a transaction that
+    rolls back, are dropped.
+    """
+    session = db.sync_session
+    transaction = session.get_nested_transaction() or session.get_transaction()
+    session.info.setdefault("feed_events", []).append((transaction, feed, unit_id, payload))
+
+
+def queue_inventory_event(db: AsyncSession, unit_id: int, payload: Dict[str, Any]) -> None:
+    queue_feed_event(db, inventory_feed, unit_id, payload)
+
+
+def queue_notification_event(db: AsyncSession, unit_id: int, payload: Dict[str, Any]) -> None:
+    queue_feed_event(db, notification_feed, unit_id, payload)
+
+
+def _within(transaction: SessionTransaction, ancestor: SessionTransaction) -> bool:
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_feed_events(session: Session) -> None:
+    # Releasing a SAVEPOINT also fires after_commit; wait for the real commit
+    if session.in_nested_transaction():
+        return
+    for _, feed, unit_id, payload in session.info.pop("feed_events", []):
+        feed.publish(unit_id, payload)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_feed_events(session: Session, previous_transaction: SessionTransaction) -> None:
+    events = session.info.get("feed_events")
+    if not events:
+        return
+    if previous_transaction.nested:
+        session.info["feed_events"] = [
+            entry for entry in events if not _within(entry[0], previous_transaction)
+        ]
+    else:
+        session.info.pop("feed_events", None)
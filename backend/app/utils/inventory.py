@@ -0,0 +1,424 @@
+from pydantic import ValidationError
+from sqlalchemy import delete, func, text, update, values, column, cast, or_, Integer, Float
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+from core.config import settings
+from db.models import Inventory, InventoryUnitStats
+from db.session import AsyncSessionLocal
+from schemas.inventory import InventoryCreate, InventoryBatchUpdate
+from utils.cache import TTLCache
+from utils.data_version import bump_data_version
+from utils.feed import queue_inventory_event
+from utils.notifications import sync_low_stock_notifications
+from typing import IO, Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import bisect
+import csv
+import io
+import time
+
+
+async def stream_inventory(unit_id: Optional[int], output_format: str) -> AsyncIterator[str]:
+    """
+    Stream inventory rows (optionally for one unit) from a server-side cursor as
+    NDJSON or as one JSON array, INVENTORY_STREAM_CHUNK_SIZE rows at a time, so
+    memory stays bounded by the chunk size rather than the catalog size.
+
+    Opens its own session: the request's session is closed before a streaming
+    response body is sent.
+    """
+    statement = select(Inventory).order_by(Inventory.id)
+    if unit_id is not None:
+        statement = statement.where(Inventory.unit_id == unit_id)
+    statement = statement.execution_options(yield_per=settings.INVENTORY_STREAM_CHUNK_SIZE)
+
+    ndjson = output_format == "ndjson"
+    first = True
+    if not ndjson:
+        yield "["
+
+    async with AsyncSessionLocal() as db:
+        result = await db.stream_scalars(statement)
+        async for partition in result.partitions():
+            lines = [item.model_dump_json() for item in partition]
+            # Rows are only read, so drop them from the identity map as we go
+            db.expunge_all()
+            if ndjson:
+                yield "\n".join(lines) + "\n"
+            else:
+                yield ("" if first else ",") + ",".join(lines)
+            first = False
+
+    if not ndjson:
+        yield "]"
+
+
+async def get_inventory_stats(db: AsyncSession, unit_id: Optional[int]) -> dict:
+    """
+    Count inventory items and items below their reorder level, per unit and in
+    total, for one unit or (with `unit_id` None) for every unit.
+
+    Reads the per-unit counters when INVENTORY_STATS_COUNTERS is enabled (one row
+    per unit), otherwise aggregates the inventory table in a single query.
+    """
+    if settings.INVENTORY_STATS_COUNTERS:
+        statement = select(
+            InventoryUnitStats.unit_id,
+            InventoryUnitStats.total_count.label("total_inventory"),
+            InventoryUnitStats.low_count.label("low_inventory_count"),
+        )
+        unit_column = InventoryUnitStats.unit_id
+    else:
+        statement = select(
+            Inventory.unit_id,
+            func.count().label("total_inventory"),
+            func.count().filter(Inventory.quantity < Inventory.reorder_level).label("low_inventory_count"),
+        ).group_by(Inventory.unit_id)
+        unit_column = Inventory.unit_id
+
+    if unit_id is not None:
+        statement = statement.where(unit_column == unit_id)
+    result = await db.execute(statement.order_by(unit_column))
+    units = [row._asdict() for row in result.all()]
+
+    return {
+        "total_inventory": sum(unit["total_inventory"] for unit in units),
+        "low_inventory_count": sum(unit["low_inventory_count"] for unit in units),
+        "units": units,
+    }
+
+
+async def rebuild_inventory_unit_stats(
+    db: AsyncSession, unit_ids: Optional[Iterable[int]] = None
+) -> None:
+    """
+    Recompute the per-unit counters from the inventory table, for the given units
+    or for every unit. The caller commits.
+    """
+    aggregate = select(
+        Inventory.unit_id,
+        func.count(),
+        func.count().filter(Inventory.quantity < Inventory.reorder_level),
+    ).group_by(Inventory.unit_id)
+    clear = delete(InventoryUnitStats)
+    if unit_ids is not None:
+        unit_ids = list(unit_ids)
+        aggregate = aggregate.where(Inventory.unit_id.in_(unit_ids))
+        clear = clear.where(InventoryUnitStats.unit_id.in_(unit_ids))
+
+    await db.execute(clear)
+    await db.execute(
+        insert(InventoryUnitStats).from_select(
+            ["unit_id", "total_count", "low_count"], aggregate
+        )
+    )
+
+
+async def adjust_inventory_unit_stats(
+    db: AsyncSession, deltas: Dict[int, Tuple[int, int]]
+) -> None:
+    """
+    Apply {unit_id: (total delta, low-stock delta)} to the per-unit counters in the
+    caller's transaction. Does nothing unless INVENTORY_STATS_COUNTERS is enabled.
+    """
+    if not settings.INVENTORY_STATS_COUNTERS:
+        return
+
+    rows = [
+        {"unit_id": unit_id, "total_count": total, "low_count": low}
+        for unit_id, (total, low) in deltas.items()
+        if total or low
+    ]
+    if not rows:
+        return
+
+    statement = insert(InventoryUnitStats).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[InventoryUnitStats.unit_id],
+        set_={
+            "total_count": InventoryUnitStats.total_count + statement.excluded.total_count,
+            "low_count": InventoryUnitStats.low_count + statement.excluded.low_count,
+        },
+    )
+    await db.execute(statement)
+
+
+def is_low_stock(quantity: int, reorder_level: int) -> bool:
+    return quantity < reorder_level
+
+
+INVENTORY_IMPORT_COLUMNS = ["line", "unit_id", "name", "description", "quantity", "reorder_level", "price"]
+
+
+def read_inventory_chunk(
+    reader: csv.DictReader, unit_id: Optional[int], size: int
+) -> Tuple[List[tuple], List[Dict[str, Any]], int]:
+    """
+    Read up to `size` CSV rows and validate them with InventoryCreate.
+    Returns (staging records, errors, rows read).
+    """
+    records: List[tuple] = []
+    errors: List[Dict[str, Any]] = []
+    rows_read = 0
+    for row in reader:
+        rows_read += 1
+        values = {key: value for key, value in row.items() if key and value not in (None, "")}
+        if unit_id is not None:
+            values["unit_id"] = unit_id
+        try:
+            item = InventoryCreate.model_validate(values)
+        except ValidationError as error:
+            errors.append({"line": reader.line_num, "detail": str(error)})
+        else:
+            records.append(
+                (reader.line_num, item.unit_id, item.name, item.description,
+                 item.quantity, item.reorder_level, item.price)
+            )
+        if rows_read >= size:
+            break
+    return records, errors, rows_read
+
+
+async def import_inventory_csv(db: AsyncSession, body: IO[bytes], unit_id: Optional[int]) -> dict:
+    """
+    Import inventory items from a CSV upload with a
+    unit_id,name,description,quantity,reorder_level,price header (unit_id may be
+    left out when `unit_id` is given). Existing items are matched on (unit_id, name)
+    and updated, the others are inserted.
+
+    Rows are read and validated in chunks of INVENTORY_IMPORT_CHUNK_SIZE on a worker
+    thread, copied into a temporary staging table with COPY, and upserted into the
+    inventory table with one statement, so memory stays bounded by the chunk size.
+    The caller commits.
+    """
+    started = time.perf_counter()
+    text_body = io.TextIOWrapper(body, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(text_body)
+
+    required = {"name", "quantity", "reorder_level", "price"}
+    if unit_id is None:
+        required.add("unit_id")
+    missing = required - set(reader.fieldnames or [])
+    if missing:
+        raise ValueError(f"Missing CSV columns: {', '.join(sorted(missing))}")
+
+    await db.execute(text(
+        "CREATE TEMPORARY TABLE inventory_import ("
+        "line integer, unit_id integer, name varchar(100), description varchar(255), "
+        "quantity integer, reorder_level integer, price double precision"
+        ") ON COMMIT DROP"
+    ))
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    copy_connection = raw_connection.driver_connection
+
+    rows = 0
+    errors: List[Dict[str, Any]] = []
+    rejected = 0
+    while True:
+        records, chunk_errors, rows_read = await asyncio.to_thread(
+            read_inventory_chunk, reader, unit_id, settings.INVENTORY_IMPORT_CHUNK_SIZE
+        )
+        if not rows_read:
+            break
+        rows += rows_read
+        rejected += len(chunk_errors)
+        errors.extend(chunk_errors[: settings.INVENTORY_IMPORT_MAX_ERRORS - len(errors)])
+        if records:
+            await copy_connection.copy_records_to_table(
+                "inventory_import", records=records, columns=INVENTORY_IMPORT_COLUMNS
+            )
+
+    # Rows for business units that do not exist are rejected
+    result = await db.execute(text(
+        "SELECT s.line, s.unit_id FROM inventory_import s "
+        "WHERE NOT EXISTS (SELECT 1 FROM businessunit b WHERE b.id = s.unit_id) "
+        "ORDER BY s.line"
+    ))
+    for row in result.all():
+        rejected += 1
+        if len(errors) < settings.INVENTORY_IMPORT_MAX_ERRORS:
+            errors.append({"line": row.line, "detail": f"Business unit {row.unit_id} not found"})
+
+    # Upsert the staged rows; when a name repeats within the file the last row wins
+    result = await db.execute(text(
+        "WITH upserted AS ("
+        " INSERT INTO inventory (unit_id, name, description, quantity, reorder_level, price, created_at)"
+        " SELECT DISTINCT ON (s.unit_id, s.name)"
+        "  s.unit_id, s.name, s.description, s.quantity, s.reorder_level, s.price, now() AT TIME ZONE 'utc'"
+        " FROM inventory_import s JOIN businessunit b ON b.id = s.unit_id"
+        " ORDER BY s.unit_id, s.name, s.line DESC"
+        " ON CONFLICT (unit_id, name) DO UPDATE SET"
+        "  description = EXCLUDED.description, quantity = EXCLUDED.quantity,"
+        "  reorder_level = EXCLUDED.reorder_level, price = EXCLUDED.price"
+        " RETURNING (xmax = 0) AS inserted"
+        ") SELECT count(*) FILTER (WHERE inserted) AS inserted, count(*) FILTER (WHERE NOT inserted) AS updated"
+        " FROM upserted"
+    ))
+    counts = result.one()
+
+    result = await db.execute(text(
+        "SELECT DISTINCT s.unit_id FROM inventory_import s JOIN businessunit b ON b.id = s.unit_id"
+    ))
+    imported_unit_ids = result.scalars().all()
+    if settings.INVENTORY_STATS_COUNTERS:
+        await rebuild_inventory_unit_stats(db, imported_unit_ids)
+    await sync_low_stock_notifications(db, imported_unit_ids)
+    await bump_data_version(db, imported_unit_ids)
+    for unit_id in imported_unit_ids:
+        queue_inventory_event(db, unit_id, {"type": "reload"})
+
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "inserted": counts.inserted,
+        "updated": counts.updated,
+        "rejected": rejected,
+        "errors": sorted(errors, key=lambda error: error["line"]),
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed) if elapsed else rows,
+    }
+
+
+async def update_inventory_batch(
+    db: AsyncSession, updates: List[InventoryBatchUpdate], unit_id: Optional[int]
+) -> List[Any]:
+    """
+    Apply many InventoryUpdate payloads with one UPDATE ... FROM (VALUES ...)
+    RETURNING statement. Fields left out of a payload keep their current value;
+    repeated ids are merged, later payloads winning. With `unit_id`, only items of
+    that unit are updated.
+
+    The rows are locked in id order first, the order reserve_stock uses, so a batch
+    cannot deadlock with concurrent orders; their previous values give the change
+    in the low-stock counters.
+
+    Returns the updated rows; ids that were not updated are missing from it.
+    The caller commits.
+    """
+    merged: Dict[int, dict] = {}
+    for item in updates:
+        merged.setdefault(item.id, {}).update(item.model_dump(exclude_unset=True, exclude={"id"}))
+
+    lock = (
+        select(Inventory.id, Inventory.quantity, Inventory.reorder_level)
+        .where(Inventory.id.in_(list(merged)))
+        .order_by(Inventory.id)
+        .with_for_update()
+    )
+    if unit_id is not None:
+        lock = lock.where(Inventory.unit_id == unit_id)
+    result = await db.execute(lock)
+    was_low = {row.id: is_low_stock(row.quantity, row.reorder_level) for row in result.all()}
+
+    update_values = values(
+        column("id", Integer),
+        column("quantity", Integer),
+        column("reorder_level", Integer),
+        column("price", Float),
+        name="updates",
+    ).data([
+        (item_id, fields.get("quantity"), fields.get("reorder_level"), fields.get("price"))
+        for item_id, fields in merged.items()
+    ])
+
+    statement = (
+        update(Inventory)
+        .where(Inventory.id == update_values.c.id)
+        # Cast explicitly: a column that is NULL in every row is typed as text
+        .values(
+            quantity=func.coalesce(cast(update_values.c.quantity, Integer), Inventory.quantity),
+            reorder_level=func.coalesce(cast(update_values.c.reorder_level, Integer), Inventory.reorder_level),
+            price=func.coalesce(cast(update_values.c.price, Float), Inventory.price),
+        )
+        .returning(*Inventory.__table__.columns)
+        .execution_options(synchronize_session=False)
+    )
+    if unit_id is not None:
+        statement = statement.where(Inventory.unit_id == unit_id)
+
+    result = await db.execute(statement)
+    rows = result.all()
+
+    deltas: Dict[int, Tuple[int, int]] = {}
+    for row in rows:
+        change = int(is_low_stock(row.quantity, row.reorder_level)) - int(was_low[row.id])
+        deltas[row.unit_id] = (0, deltas.get(row.unit_id, (0, 0))[1] + change)
+    await adjust_inventory_unit_stats(db, deltas)
+
+    return rows
+
+
+async def search_inventory(
+    db: AsyncSession, query: str, unit_id: Optional[int], limit: int
+) -> List[Inventory]:
+    """
+    Find inventory items whose name or description contains `query`, case-insensitively.
+    The ILIKE filters are served by the pg_trgm GIN indexes created in init_db.
+    Names starting with the query are listed first.
+    """
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    pattern = f"%{escaped}%"
+    statement = select(Inventory).where(
+        or_(Inventory.name.ilike(pattern), Inventory.description.ilike(pattern))
+    )
+    if unit_id is not None:
+        statement = statement.where(Inventory.unit_id == unit_id)
+    statement = statement.order_by(
+        Inventory.name.ilike(f"{escaped}%").desc(), Inventory.name, Inventory.id
+    ).limit(limit)
+
+    result = await db.execute(statement)
+    return result.scalars().all()
+
+
+class InventoryNameIndex:
+    """
+    Sorted, case-insensitive index of one unit's item names for prefix lookups.
+    """
+
+    def __init__(self, items: Iterable[Tuple[int, str]]):
+        self._entries = sorted((name.lower(), name, item_id) for item_id, name in items)
+        self._keys = [key for key, _, _ in self._entries]
+
+    def complete(self, prefix: str, limit: int) -> List[dict]:
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self._keys, prefix)
+        matches = []
+        for key, name, item_id in self._entries[start:start + limit]:
+            if not key.startswith(prefix):
+                break
+            matches.append({"id": item_id, "name": name})
+        return matches
+
+
+inventory_name_indexes = TTLCache(
+    maxsize=settings.INVENTORY_NAME_INDEX_UNITS, ttl=settings.INVENTORY_NAME_INDEX_TTL_SECONDS
+)
+
+
+async def get_inventory_name_index(db: AsyncSession, unit_id: int) -> InventoryNameIndex:
+    """
+    Return the unit's name index, loading it with one query when it is not cached.
+    """
+    name_index = inventory_name_indexes.get(unit_id)
+    if name_index is None:
+        result = await db.execute(
+            select(Inventory.id, Inventory.name).where(Inventory.unit_id == unit_id)
+        )
+        name_index = InventoryNameIndex(result.all())
+        inventory_name_indexes.set(unit_id, name_index)
+    return name_index
+
+
+def invalidate_inventory_name_index(*unit_ids: Optional[int]) -> None:
+    """
+    Drop cached name indexes after items were added or removed; with no
+    arguments every unit's index is dropped. Call after the write is committed.
+    Other worker processes pick the change up once their copy expires.
+    """
+    if not unit_ids:
+        inventory_name_indexes.clear()
+    for unit_id in unit_ids:
+        inventory_name_indexes.pop(unit_id)
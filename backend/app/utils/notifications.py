@@ -0,0 +1,207 @@
+from sqlalchemy import and_, delete, func, literal, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.models import Inventory, Notification, NotificationArchive
+from core.config import settings
+from utils.feed import queue_notification_event
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+
+# Shared by low_stock_message and the SQL format() in sync_low_stock_notifications
+LOW_STOCK_MESSAGE = "Inventory for item '%s' is below the reorder level. Current quantity: %s"
+
+
+def low_stock_message(name: str, quantity: int) -> str:
+    return LOW_STOCK_MESSAGE % (name, quantity)
+
+
+def notification_event(notification) -> dict:
+    return {
+        "id": notification.id,
+        "inventory_id": notification.inventory_id,
+        "message": notification.message,
+        "resolved": notification.resolved,
+        "created_at": notification.created_at,
+        "resolved_at": notification.resolved_at,
+    }
+
+
+async def open_low_stock_notifications(
+    db: AsyncSession, items: Iterable[Tuple[int, int, str, int]]
+) -> None:
+    """
+    Open a low-stock notification for each (inventory id, unit id, name, quantity),
+    skipping items that already have an open one. Subscribers of the unit are
+    notified once the caller commits.
+    """
+    created_at = datetime.utcnow()
+    unit_ids = {}
+    rows = []
+    for inventory_id, unit_id, name, quantity in items:
+        unit_ids[inventory_id] = unit_id
+        rows.append({
+            "inventory_id": inventory_id,
+            "message": low_stock_message(name, quantity),
+            "resolved": False,
+            "created_at": created_at,
+        })
+    if not rows:
+        return
+
+    statement = (
+        insert(Notification)
+        .values(rows)
+        .on_conflict_do_nothing(
+            index_elements=[Notification.inventory_id],
+            index_where=Notification.resolved == False,
+        )
+        .returning(Notification)
+    )
+    result = await db.execute(statement)
+    for notification in result.scalars().all():
+        queue_notification_event(
+            db,
+            unit_ids[notification.inventory_id],
+            {"type": "opened", "notification": notification_event(notification)},
+        )
+
+
+async def _resolve_open_notifications(db: AsyncSession, *conditions) -> List[int]:
+    """
+    Resolve the open notifications whose item matches `conditions` with one UPDATE
+    ... FROM inventory, queue a "resolved" event for each and return their ids.
+    """
+    # Core UPDATE ... FROM so the item's unit can be returned with each row
+    notification = Notification.__table__
+    statement = (
+        update(notification)
+        .where(notification.c.inventory_id == Inventory.id, notification.c.resolved == False, *conditions)
+        .values(resolved=True, resolved_at=datetime.utcnow())
+        .returning(*notification.c, Inventory.unit_id)
+    )
+    result = await db.execute(statement)
+    resolved = []
+    for row in result.all():
+        resolved.append(row.id)
+        queue_notification_event(
+            db, row.unit_id, {"type": "resolved", "notification": notification_event(row)}
+        )
+    return resolved
+
+
+async def resolve_notifications(
+    db: AsyncSession, notification_ids: List[int], unit_id: Optional[int] = None
+) -> List[int]:
+    """
+    Resolve the open notifications among `notification_ids` (restricted to the items
+    of `unit_id` if given) with one UPDATE, and return the ids that were resolved.
+    Subscribers are notified once the caller commits.
+    """
+    if not notification_ids:
+        return []
+
+    conditions = [Notification.id.in_(notification_ids)]
+    if unit_id is not None:
+        conditions.append(Inventory.unit_id == unit_id)
+    return await _resolve_open_notifications(db, *conditions)
+
+
+async def resolve_restocked_notifications(db: AsyncSession, inventory_ids: Iterable[int]) -> None:
+    """
+    Resolve the open notifications of the given items that are back at or above
+    their reorder level. The items' changes must already be flushed.
+    """
+    inventory_ids = list(inventory_ids)
+    if inventory_ids:
+        await _resolve_open_notifications(
+            db, Inventory.id.in_(inventory_ids), Inventory.quantity >= Inventory.reorder_level
+        )
+
+
+async def sync_low_stock_notifications(db: AsyncSession, unit_ids: Optional[Iterable[int]] = None) -> None:
+    """
+    Bring the open notifications of the given units (or every unit) in line with
+    their stock: open one for every item below its reorder level that has none and
+    resolve those of items back at or above it, one statement each.
+    """
+    low_items = select(
+        Inventory.id,
+        func.format(LOW_STOCK_MESSAGE, Inventory.name, Inventory.quantity),
+        literal(False),
+        literal(datetime.utcnow()),
+    ).where(Inventory.quantity < Inventory.reorder_level)
+    restocked = [Inventory.quantity >= Inventory.reorder_level]
+    if unit_ids is not None:
+        unit_ids = list(unit_ids)
+        low_items = low_items.where(Inventory.unit_id.in_(unit_ids))
+        restocked.append(Inventory.unit_id.in_(unit_ids))
+
+    notification = Notification.__table__
+    opened = (
+        insert(notification)
+        .from_select(["inventory_id", "message", "resolved", "created_at"], low_items)
+        .on_conflict_do_nothing(
+            index_elements=[notification.c.inventory_id],
+            index_where=notification.c.resolved == False,
+        )
+        .returning(*notification.c)
+        .cte("opened")
+    )
+    result = await db.execute(
+        select(opened, Inventory.unit_id).join(Inventory, Inventory.id == opened.c.inventory_id)
+    )
+    for row in result.all():
+        queue_notification_event(
+            db, row.unit_id, {"type": "opened", "notification": notification_event(row)}
+        )
+
+    await _resolve_open_notifications(db, *restocked)
+
+
+async def delete_inventory_notifications(db: AsyncSession, inventory_id: int) -> None:
+    """
+    Resolve the item's open notification, then delete all of its notifications so
+    the item itself can be deleted.
+    """
+    await _resolve_open_notifications(db, Inventory.id == inventory_id)
+    await db.execute(delete(Notification).where(Notification.inventory_id == inventory_id))
+
+
+async def archive_resolved_notifications(db: AsyncSession) -> int:
+    """
+    Move notifications resolved more than NOTIFICATION_RETENTION_DAYS ago into the
+    archive table, in batches that each commit, and return how many were moved.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=settings.NOTIFICATION_RETENTION_DAYS)
+    columns = ["id", "inventory_id", "message", "resolved", "created_at", "resolved_at"]
+    archived = 0
+    while True:
+        # Notifications resolved before resolved_at was recorded count from created_at
+        expired = (
+            select(Notification.id)
+            .where(
+                Notification.resolved == True,
+                or_(
+                    Notification.resolved_at < cutoff,
+                    and_(Notification.resolved_at.is_(None), Notification.created_at < cutoff),
+                ),
+            )
+            .limit(settings.NOTIFICATION_ARCHIVE_BATCH_SIZE)
+        )
+        moved = (
+            delete(Notification)
+            .where(Notification.id.in_(expired.scalar_subquery()))
+            .returning(*(getattr(Notification, column) for column in columns))
+            .cte("moved")
+        )
+        statement = insert(NotificationArchive).from_select(
+            columns + ["archived_at"],
+            select(*(moved.c[column] for column in columns), literal(datetime.utcnow())),
+        )
+        result = await db.execute(statement)
+        await db.commit()
+
+        archived += result.rowcount
+        if result.rowcount < settings.NOTIFICATION_ARCHIVE_BATCH_SIZE:
+            return archived
@@ -0,0 +1,480 @@
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import insert, update, tuple_
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+from core.config import settings
+from db.models import Order, OrderItem, Inventory, BusinessUnit
+from db.session import AsyncSessionLocal
+from schemas.order import OrderCreate, OrderResponse
+from utils.cache import TTLCache
+from utils.stock import reserve_stock, decrement_stock, run_in_transaction, is_retryable_error
+from utils.data_version import bump_data_version
+from utils.feed import queue_inventory_event
+from utils.inventory import adjust_inventory_unit_stats
+from utils.sales import record_sales
+from datetime import datetime, timedelta
+from typing import IO, AsyncIterator, Dict, List, Optional, Tuple, Union
+import asyncio
+import json
+
+# Responses of recently placed orders, keyed on (user_id, Idempotency-Key)
+idempotency_cache = TTLCache(
+    settings.IDEMPOTENCY_CACHE_SIZE, settings.IDEMPOTENCY_KEY_TTL_SECONDS
+)
+
+
+async def find_idempotent_order(
+    db: AsyncSession, user_id: int, idempotency_key: str, use_cache: bool = True
+) -> Optional[OrderResponse]:
+    """
+    Return the order already placed with this Idempotency-Key, if the key is still held.
+    Served from the in-process cache when possible, from the Order table otherwise.
+    Pass `use_cache=False` inside a transaction that has not committed yet, so an
+    order that may still roll back is neither served from nor added to the cache.
+
+    A key past its TTL still matches until purge_expired_idempotency_keys clears it,
+    since the unique index keeps rejecting it until then.
+    """
+    if use_cache:
+        cached = idempotency_cache.get((user_id, idempotency_key))
+        if cached is not None:
+            return cached
+
+    statement = select(Order).where(
+        Order.user_id == user_id,
+        Order.idempotency_key == idempotency_key,
+    )
+    result = await db.execute(statement)
+    order = result.scalars().first()
+    if order is None:
+        return None
+
+    response = OrderResponse.model_validate(order)
+    if use_cache:
+        idempotency_cache.set((user_id, idempotency_key), response)
+    return response
+
+
+async def purge_expired_idempotency_keys(db: AsyncSession) -> int:
+    """
+    Clear Idempotency-Keys older than the TTL from the Order table and the cache.
+    """
+    idempotency_cache.expire()
+
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS)
+    statement = (
+        update(Order)
+        .where(Order.idempotency_key.is_not(None), Order.created_at < cutoff)
+        .values(idempotency_key=None)
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(statement)
+    await db.commit()
+    return result.rowcount
+
+
+async def create_order(
+    db: AsyncSession,
+    user_id: Optional[int],
+    unit_id: int,
+    order_create: OrderCreate,
+    idempotency_key: Optional[str] = None,
+    sales: Optional[list] = None,
+    stats_deltas: Optional[Dict[int, Tuple[int, int]]] = None,
+) -> Order:
+    """
+    Reserve stock and insert an Order with all of its OrderItems.
+
+    Everything runs on the caller's transaction; nothing is committed here so the
+    whole placement either lands in one commit or not at all.
+    When `sales` is given the order is appended to it instead, and the caller passes
+    it to record_sales and bumps the data version of its units before committing.
+    Likewise, with `stats_deltas` the low-stock counter changes are collected there
+    for the caller to apply.
+    """
+    reserved = await reserve_stock(db, unit_id, order_create.items, stats_deltas)
+
+    total_amount = sum(
+        item.quantity * reserved[item.inventory_name]["price"] for item in order_create.items
+    )
+
+    # Create the order and flush to obtain its id
+    order = Order(
+        user_id=user_id,
+        unit_id=unit_id,
+        order_type=order_create.order_type,
+        total_amount=total_amount,
+        idempotency_key=idempotency_key,
+    )
+    db.add(order)
+    await db.flush()
+
+    # Create all order items in a single executemany
+    order_items = [
+        (reserved[item.inventory_name]["id"], item.quantity, reserved[item.inventory_name]["price"])
+        for item in order_create.items
+    ]
+    # An empty executemany would emit INSERT ... DEFAULT VALUES, so skip it
+    if order_items:
+        await db.execute(
+            insert(OrderItem),
+            [
+                {"order_id": order.id, "inventory_id": inventory_id, "quantity": quantity, "price": price}
+                for inventory_id, quantity, price in order_items
+            ],
+        )
+    if sales is None:
+        await record_sales(db, [(order, order_items)])
+        await bump_data_version(db, [unit_id])
+    else:
+        sales.append((order, order_items))
+    queue_inventory_event(db, unit_id, {
+        "type": "stock",
+        "items": [
+            {"id": row["id"], "name": name, "quantity": row["quantity"]}
+            for name, row in reserved.items()
+        ],
+    })
+
+    return order
+
+
+async def create_orders_bulk(
+    db: AsyncSession, user_id: Optional[int], records: List[OrderCreate]
+) -> List[Union[OrderResponse, str]]:
+    """
+    Place a batch of orders with a fixed number of statements.
+
+    Units and inventory rows for the whole batch are resolved (and locked in id
+    order) up front, each record is checked against the running stock levels, and
+    the accepted records are written with one stock UPDATE, one multi-row Order
+    INSERT and one OrderItem executemany. A record that cannot be placed is
+    reported and skipped without affecting the others.
+
+    Returns, per record, its OrderResponse or the reason it was rejected.
+    Nothing is committed here.
+    """
+    # Resolve every business unit named in the batch
+    unit_names = {record.unit_name for record in records}
+    result = await db.execute(
+        select(BusinessUnit.id, BusinessUnit.name).where(BusinessUnit.name.in_(unit_names))
+    )
+    unit_ids = {row.name: row.id for row in result.all()}
+
+    # Resolve and lock every (unit, item name) pair in the batch
+    pairs = {
+        (unit_ids[record.unit_name], item.inventory_name)
+        for record in records
+        if record.unit_name in unit_ids
+        for item in record.items
+    }
+    inventory: Dict[Tuple[int, str], dict] = {}
+    if pairs:
+        result = await db.execute(
+            select(Inventory.id, Inventory.unit_id, Inventory.name, Inventory.quantity, Inventory.price)
+            .where(tuple_(Inventory.unit_id, Inventory.name).in_(list(pairs)))
+            .order_by(Inventory.id)
+            .with_for_update()
+        )
+        inventory = {(row.unit_id, row.name): row._asdict() for row in result.all()}
+
+    # Check each record against the stock left by the records before it
+    outcomes: List[Union[Order, str]] = []
+    decrements: Dict[int, int] = {}
+    for record in records:
+        unit_id = unit_ids.get(record.unit_name)
+        if unit_id is None:
+            outcomes.append("Business unit does not exist.")
+            continue
+
+        requested: Dict[str, int] = {}
+        for item in record.items:
+            requested[item.inventory_name] = requested.get(item.inventory_name, 0) + item.quantity
+
+        error = None
+        for name, quantity in requested.items():
+            row = inventory.get((unit_id, name))
+            if row is None:
+                error = f"Inventory item '{name}' does not exist in this business unit."
+                break
+            if row["quantity"] < quantity:
+                error = f"Not enough stock for item '{name}'. Available: {row['quantity']}"
+                break
+        if error:
+            outcomes.append(error)
+            continue
+
+        for name, quantity in requested.items():
+            row = inventory[(unit_id, name)]
+            row["quantity"] -= quantity
+            decrements[row["id"]] = decrements.get(row["id"], 0) + quantity
+
+        outcomes.append(
+            Order(
+                user_id=user_id,
+                unit_id=unit_id,
+                order_type=record.order_type,
+                total_amount=sum(
+                    item.quantity * inventory[(unit_id, item.inventory_name)]["price"]
+                    for item in record.items
+                ),
+            )
+        )
+
+    accepted = [
+        (record, order) for record, order in zip(records, outcomes) if isinstance(order, Order)
+    ]
+    if not accepted:
+        return outcomes
+
+    # The rows are locked, so every decrement checked above will apply
+    updated = await decrement_stock(db, decrements)
+
+    # Insert all orders in one multi-row statement, keeping the ids in input order
+    result = await db.execute(
+        insert(Order).returning(Order.id, sort_by_parameter_order=True),
+        [
+            {
+                "user_id": order.user_id,
+                "unit_id": order.unit_id,
+                "order_type": order.order_type,
+                "total_amount": order.total_amount,
+                "created_at": order.created_at,
+            }
+            for _, order in accepted
+        ],
+    )
+    for (_, order), order_id in zip(accepted, result.scalars().all()):
+        order.id = order_id
+
+    order_items = [
+        (
+            order,
+            [
+                (
+                    inventory[(order.unit_id, item.inventory_name)]["id"],
+                    item.quantity,
+                    inventory[(order.unit_id, item.inventory_name)]["price"],
+                )
+                for item in record.items
+            ],
+        )
+        for record, order in accepted
+    ]
+    item_rows = [
+        {"order_id": order.id, "inventory_id": inventory_id, "quantity": quantity, "price": price}
+        for order, items in order_items
+        for inventory_id, quantity, price in items
+    ]
+    # Accepted records may all be empty, and an empty executemany fails
+    if item_rows:
+        await db.execute(insert(OrderItem), item_rows)
+    await record_sales(db, order_items)
+    await bump_data_version(db, {order.unit_id for _, order in accepted})
+
+    names = {row["id"]: name for (_, name), row in inventory.items()}
+    stock_changes: Dict[int, List[dict]] = {}
+    for row in updated.values():
+        stock_changes.setdefault(row.unit_id, []).append(
+            {"id": row.id, "name": names[row.id], "quantity": row.quantity}
+        )
+    for unit_id, items in stock_changes.items():
+        queue_inventory_event(db, unit_id, {"type": "stock", "items": items})
+
+    return [
+        OrderResponse.model_validate(outcome) if isinstance(outcome, Order) else outcome
+        for outcome in outcomes
+    ]
+
+
+async def stream_bulk_orders(body: IO[bytes], user_id: Optional[int]) -> AsyncIterator[str]:
+    """
+    Read NDJSON OrderCreate records from `body` and place them in chunks of
+    ORDER_BULK_CHUNK_SIZE, yielding one NDJSON result line per input line.
+
+    Each chunk is committed on its own, so only one chunk of records and
+    results is held in memory at a time.
+    """
+    async with AsyncSessionLocal() as db:
+        chunk: List[Tuple[int, Union[OrderCreate, str]]] = []
+        line_number = 0
+
+        async def flush() -> AsyncIterator[str]:
+            records = [entry for _, entry in chunk if isinstance(entry, OrderCreate)]
+            try:
+                placed = await run_in_transaction(
+                    db, lambda: create_orders_bulk(db, user_id, records)
+                )
+            except Exception as error:
+                print(f"Error placing bulk orders: {error}")
+                placed = ["Batch could not be committed."] * len(records)
+
+            placed_iter = iter(placed)
+            for number, entry in chunk:
+                outcome = next(placed_iter) if isinstance(entry, OrderCreate) else entry
+                if isinstance(outcome, OrderResponse):
+                    line = {"line": number, "status": "created", "order": outcome.model_dump(mode="json")}
+                else:
+                    line = {"line": number, "status": "error", "detail": outcome}
+                yield json.dumps(line) + "\n"
+
+        for raw_line in body:
+            line_number += 1
+            if not raw_line.strip():
+                continue
+            try:
+                chunk.append((line_number, OrderCreate.model_validate_json(raw_line)))
+            except ValidationError as error:
+                chunk.append((line_number, str(error)))
+
+            if len(chunk) >= settings.ORDER_BULK_CHUNK_SIZE:
+                async for line in flush():
+                    yield line
+                chunk = []
+
+        if chunk:
+            async for line in flush():
+                yield line
+
+
+class OrderWriter:
+    """
+    Write-behind queue for order placement (group commit).
+
+    Callers submit already-validated orders and await the result. A single writer
+    task drains the queue in batches of up to `batch_size` orders, or whatever has
+    arrived within `linger_ms` of the first one, and commits each batch in one
+    transaction. Every order runs inside its own SAVEPOINT, so an order that fails
+    validation (unknown item, not enough stock) only fails its own caller.
+    """
+
+    def __init__(self, batch_size: int, linger_ms: int):
+        self.batch_size = max(batch_size, 1)
+        self.linger = linger_ms / 1000
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            # A fresh queue, bound to the loop the writer now runs on
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        # Fail whatever is still queued instead of leaving callers hanging
+        while not self._queue.empty():
+            *_, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(
+                    HTTPException(
+                        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        detail="Order service is shutting down.",
+                    )
+                )
+
+    async def submit(
+        self,
+        user_id: Optional[int],
+        unit_id: int,
+        order_create: OrderCreate,
+        idempotency_key: Optional[str] = None,
+    ) -> OrderResponse:
+        """
+        Queue an order and wait until the batch containing it has committed.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((user_id, unit_id, order_create, idempotency_key, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.linger
+
+            # Collect until the batch is full or the linger time runs out
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[tuple]) -> None:
+        async with AsyncSessionLocal() as db:
+
+            async def write_batch() -> list:
+                outcomes = []
+                sales = []
+                stats_deltas: Dict[int, Tuple[int, int]] = {}
+                for user_id, unit_id, order_create, idempotency_key, _ in batch:
+                    try:
+                        order_sales = []
+                        order_deltas: Dict[int, Tuple[int, int]] = {}
+                        async with db.begin_nested():
+                            order = await create_order(
+                                db, user_id, unit_id, order_create, idempotency_key,
+                                order_sales, order_deltas,
+                            )
+                        sales.extend(order_sales)
+                        for delta_unit_id, (total, low) in order_deltas.items():
+                            previous = stats_deltas.get(delta_unit_id, (0, 0))
+                            stats_deltas[delta_unit_id] = (previous[0] + total, previous[1] + low)
+                        outcomes.append(OrderResponse.model_validate(order))
+                    except HTTPException as error:
+                        outcomes.append(error)
+                    except IntegrityError as error:
+                        # Same Idempotency-Key already placed, possibly earlier in this
+                        # batch; cached below only once the batch has committed
+                        existing = None
+                        if idempotency_key:
+                            existing = await find_idempotent_order(
+                                db, user_id, idempotency_key, use_cache=False
+                            )
+                        outcomes.append(existing if existing is not None else error)
+                    except DBAPIError as error:
+                        # Serialization failures and deadlocks retry the whole batch;
+                        # anything else (e.g. an out-of-range value) fails only this order
+                        if is_retryable_error(error):
+                            raise
+                        outcomes.append(error)
+                # One set of rollup upserts for every order the batch placed, and the
+                # stats and version rows locked last, after every inventory row
+                await record_sales(db, sales)
+                await adjust_inventory_unit_stats(db, stats_deltas)
+                await bump_data_version(db, {order.unit_id for order, _ in sales})
+                return outcomes
+
+            try:
+                outcomes = await run_in_transaction(db, write_batch)
+            except Exception as error:
+                outcomes = [error] * len(batch)
+
+        # Resolve each caller only once its batch has committed
+        for (user_id, _, _, idempotency_key, future), outcome in zip(batch, outcomes):
+            if not isinstance(outcome, Exception) and idempotency_key:
+                idempotency_cache.set((user_id, idempotency_key), outcome)
+            if future.done():
+                continue
+            if isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+
+order_writer = OrderWriter(settings.ORDER_BATCH_SIZE, settings.ORDER_BATCH_LINGER_MS)
@@ -0,0 +1,225 @@
+from sqlalchemy import Date, DateTime, cast, delete, func, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from db.models import Order, OrderItem, DailyUnitSales, DailyItemSales, DailyCustomerSales
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ROLLUP_TABLES = ["dailyunitsales", "dailyitemsales", "dailycustomersales"]
+
+
+async def record_sales(
+    db: AsyncSession, orders: Iterable[Tuple[Order, List[Tuple[int, int, float]]]]
+) -> None:
+    """
+    Add placed orders, each given as (order, [(inventory_id, quantity, price)]), to
+    the daily sales rollups in the caller's transaction.
+
+    The orders are aggregated here first, so a batch costs one upsert per rollup
+    table. Rows are written in key order so concurrent placements lock them in the
+    same order.
+    """
+    units: Dict[tuple, list] = {}
+    items: Dict[tuple, list] = {}
+    customers: Dict[tuple, list] = {}
+    for order, order_items in orders:
+        day = order.created_at.date()
+        unit_row = units.setdefault((order.unit_id, day), [0, 0.0])
+        unit_row[0] += 1
+        unit_row[1] += order.total_amount
+        for inventory_id, quantity, price in order_items:
+            item_row = items.setdefault((order.unit_id, day, inventory_id), [0, 0.0])
+            item_row[0] += quantity
+            item_row[1] += quantity * price
+        if order.user_id is not None:
+            customer_row = customers.setdefault((order.unit_id, day, order.user_id), [0, 0.0])
+            customer_row[0] += 1
+            customer_row[1] += order.total_amount
+
+    if units:
+        await _upsert(
+            db, DailyUnitSales, ["unit_id", "day"], ["order_count", "total_sales"], units
+        )
+    if items:
+        await _upsert(
+            db, DailyItemSales, ["unit_id", "day", "inventory_id"], ["quantity", "revenue"], items
+        )
+    if customers:
+        await _upsert(
+            db, DailyCustomerSales, ["unit_id", "day", "user_id"], ["order_count", "total_spent"], customers
+        )
+
+
+async def _upsert(db: AsyncSession, model, keys: List[str], values: List[str], rows: Dict[tuple, list]) -> None:
+    statement = insert(model).values(
+        [dict(zip(keys + values, key + tuple(row))) for key, row in sorted(rows.items())]
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=keys,
+        set_={value: getattr(model, value) + getattr(statement.excluded, value) for value in values},
+    )
+    await db.execute(statement)
+
+
+async def rebuild_sales_rollups(db: AsyncSession, unit_ids: Optional[Iterable[int]] = None) -> None:
+    """
+    Recompute the daily sales rollups from the order history, for the given units
+    or for every unit. The rollup tables are locked against order placement until
+    the caller commits, so no order is counted twice or missed.
+    """
+    await db.execute(text(f"LOCK TABLE {', '.join(ROLLUP_TABLES)} IN EXCLUSIVE MODE"))
+
+    day = cast(Order.created_at, Date)
+    unit_sales = select(
+        Order.unit_id, day, func.count(Order.id), func.sum(Order.total_amount)
+    ).group_by(Order.unit_id, day)
+    item_sales = (
+        select(
+            Order.unit_id,
+            day,
+            OrderItem.inventory_id,
+            func.sum(OrderItem.quantity),
+            func.sum(OrderItem.quantity * OrderItem.price),
+        )
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .group_by(Order.unit_id, day, OrderItem.inventory_id)
+    )
+    customer_sales = (
+        select(Order.unit_id, day, Order.user_id, func.count(Order.id), func.sum(Order.total_amount))
+        .where(Order.user_id.is_not(None))
+        .group_by(Order.unit_id, day, Order.user_id)
+    )
+
+    rollups = [
+        (DailyUnitSales, unit_sales, ["unit_id", "day", "order_count", "total_sales"]),
+        (DailyItemSales, item_sales, ["unit_id", "day", "inventory_id", "quantity", "revenue"]),
+        (DailyCustomerSales, customer_sales, ["unit_id", "day", "user_id", "order_count", "total_spent"]),
+    ]
+    if unit_ids is not None:
+        unit_ids = list(unit_ids)
+    for model, aggregate, columns in rollups:
+        clear = delete(model)
+        if unit_ids is not None:
+            aggregate = aggregate.where(Order.unit_id.in_(unit_ids))
+            clear = clear.where(model.unit_id.in_(unit_ids))
+        await db.execute(clear)
+        await db.execute(insert(model).from_select(columns, aggregate))
+
+
+async def sales_rollups_missing(db: AsyncSession) -> bool:
+    """
+    True when there are orders but no rollup rows, e.g. on first start after the
+    rollups were introduced.
+    """
+    has_orders = await db.execute(select(select(Order.id).exists()))
+    has_rollups = await db.execute(select(select(DailyUnitSales.unit_id).exists()))
+    return bool(has_orders.scalar()) and not has_rollups.scalar()
+
+
+def bucket_start(day: date, granularity: str) -> date:
+    """
+    First day of the day, week (starting Monday) or month bucket containing `day`.
+    """
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_bucket_start(start: date, granularity: str) -> date:
+    if granularity == "week":
+        return start + timedelta(days=7)
+    if granularity == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def bucket_count(start: date, end: date, granularity: str) -> int:
+    """
+    Number of buckets overlapping [start, end), computed without listing them.
+    """
+    first = bucket_start(start, granularity)
+    if first >= end:
+        return 0
+    if granularity == "week":
+        return -(-(end - first).days // 7)
+    if granularity == "month":
+        months = (end.year * 12 + end.month) - (first.year * 12 + first.month)
+        return months + (1 if end.day > 1 else 0)
+    return (end - first).days
+
+
+def bucket_starts(start: date, end: date, granularity: str) -> List[date]:
+    """
+    Start of every bucket overlapping [start, end).
+    """
+    starts = []
+    current = bucket_start(start, granularity)
+    while current < end:
+        starts.append(current)
+        try:
+            current = next_bucket_start(current, granularity)
+        except OverflowError:
+            # The last bucket before date.max
+            break
+    return starts
+
+
+async def sales_time_series(
+    db: AsyncSession,
+    start: date,
+    end: date,
+    unit_id: Optional[int],
+    granularity: str,
+    buckets: Optional[List[date]] = None,
+) -> List[dict]:
+    """
+    Sales and order counts per day, week or month for [start, end), for one unit or
+    every unit, with a zero-filled entry for every bucket without sales.
+    `buckets` is the output of bucket_starts when the caller already built it.
+
+    Reads the daily rollup with a plain range on its day column, which the
+    (unit_id, day) key and the day index serve directly.
+    """
+    bucket = cast(func.date_trunc(granularity, cast(DailyUnitSales.day, DateTime)), Date)
+    statement = (
+        select(
+            bucket.label("period_start"),
+            func.sum(DailyUnitSales.total_sales).label("total_sales"),
+            func.sum(DailyUnitSales.order_count).label("order_count"),
+        )
+        .where(DailyUnitSales.day >= start, DailyUnitSales.day < end)
+        .group_by(bucket)
+    )
+    if unit_id is not None:
+        statement = statement.where(DailyUnitSales.unit_id == unit_id)
+
+    result = await db.execute(statement)
+    totals = {row.period_start: row for row in result.all()}
+
+    points = []
+    if buckets is None:
+        buckets = bucket_starts(start, end, granularity)
+    for period_start in buckets:
+        row = totals.get(period_start)
+        points.append({
+            "period_start": period_start,
+            "total_sales": row.total_sales if row else 0,
+            "order_count": row.order_count if row else 0,
+        })
+    return points
+
+
+async def sales_date_range(db: AsyncSession, unit_id: Optional[int]) -> Optional[Tuple[date, date]]:
+    """
+    First and last day with sales, for one unit or every unit, or None without sales.
+    """
+    statement = select(func.min(DailyUnitSales.day), func.max(DailyUnitSales.day))
+    if unit_id is not None:
+        statement = statement.where(DailyUnitSales.unit_id == unit_id)
+    result = await db.execute(statement)
+    first_day, last_day = result.one()
+    if first_day is None:
+        return None
+    return first_day, last_day
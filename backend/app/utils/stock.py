@@ -0,0 +1,190 @@
+from fastapi import HTTPException, status
+from sqlalchemy import update, values, column, Integer
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+from core.config import settings
+from db.models import Inventory
+from utils.inventory import adjust_inventory_unit_stats, is_low_stock
+from utils.notifications import open_low_stock_notifications
+from schemas.order import OrderItemCreate
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+import asyncio
+import random
+
+T = TypeVar("T")
+
+# serialization_failure and deadlock_detected: safe to retry the whole transaction
+RETRYABLE_SQLSTATES = {"40001", "40P01"}
+
+
+def is_retryable_error(error: DBAPIError) -> bool:
+    """
+    Check whether a database error is a transient serialization failure or deadlock.
+    """
+    orig = error.orig
+    sqlstate = getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)
+    if sqlstate is None and orig is not None:
+        sqlstate = getattr(orig.__cause__, "sqlstate", None)
+    return sqlstate in RETRYABLE_SQLSTATES
+
+
+async def run_in_transaction(
+    db: AsyncSession, operation: Callable[[], Awaitable[T]]
+) -> T:
+    """
+    Run `operation` and commit, retrying the whole transaction a bounded number of
+    times when Postgres aborts it with a serialization failure or deadlock.
+    Any other error rolls the transaction back and is re-raised.
+    """
+    attempts = max(settings.STOCK_RETRY_ATTEMPTS, 1)
+    for attempt in range(1, attempts + 1):
+        try:
+            result = await operation()
+            await db.commit()
+            return result
+        except DBAPIError as error:
+            await db.rollback()
+            if attempt == attempts or not is_retryable_error(error):
+                raise
+        except Exception:
+            await db.rollback()
+            raise
+
+        # Jittered backoff so the competing transactions do not collide again
+        backoff = settings.STOCK_RETRY_BACKOFF_MS * attempt * random.uniform(0.5, 1.5)
+        await asyncio.sleep(backoff / 1000)
+
+
+async def decrement_stock(
+    db: AsyncSession,
+    decrements: Dict[int, int],
+    stats_deltas: Optional[Dict[int, Tuple[int, int]]] = None,
+) -> Dict[int, Any]:
+    """
+    Subtract quantities from inventory rows with one conditional
+    UPDATE ... FROM (VALUES ...) WHERE quantity >= n RETURNING statement.
+
+    `decrements` maps inventory id to the amount to take. Rows without enough
+    stock are left untouched and are missing from the returned mapping of
+    inventory id to the updated (id, unit_id, name, price, quantity, reorder_level) row.
+    Items that drop below their reorder level get a low-stock notification and are
+    counted in the per-unit stats. When `stats_deltas` is given the counter changes
+    are added to it instead, and the caller applies them with adjust_inventory_unit_stats.
+    """
+    if not decrements:
+        return {}
+
+    decrement_values = values(
+        column("id", Integer), column("quantity", Integer), name="decrements"
+    ).data(list(decrements.items()))
+
+    statement = (
+        update(Inventory)
+        .where(
+            Inventory.id == decrement_values.c.id,
+            Inventory.quantity >= decrement_values.c.quantity,
+        )
+        .values(quantity=Inventory.quantity - decrement_values.c.quantity)
+        .returning(
+            Inventory.id,
+            Inventory.unit_id,
+            Inventory.name,
+            Inventory.price,
+            Inventory.quantity,
+            Inventory.reorder_level,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    result = await db.execute(statement)
+    updated = {row.id: row for row in result.all()}
+
+    # Notify and count the items that just crossed their reorder level
+    crossed = [
+        row for row in updated.values()
+        if is_low_stock(row.quantity, row.reorder_level)
+        and not is_low_stock(row.quantity + decrements[row.id], row.reorder_level)
+    ]
+    if crossed:
+        await open_low_stock_notifications(
+            db, [(row.id, row.unit_id, row.name, row.quantity) for row in crossed]
+        )
+        deltas: Dict[int, Tuple[int, int]] = {} if stats_deltas is None else stats_deltas
+        for row in crossed:
+            deltas[row.unit_id] = (0, deltas.get(row.unit_id, (0, 0))[1] + 1)
+        if stats_deltas is None:
+            await adjust_inventory_unit_stats(db, deltas)
+
+    return updated
+
+
+async def reserve_stock(
+    db: AsyncSession,
+    unit_id: int,
+    items: List[OrderItemCreate],
+    stats_deltas: Optional[Dict[int, Tuple[int, int]]] = None,
+) -> Dict[str, dict]:
+    """
+    Resolve the ordered inventory names for a unit and decrement their stock.
+
+    All names are resolved with one batched SELECT and all decrements are applied
+    with one conditional UPDATE ... FROM (VALUES ...) RETURNING, so the cost does not
+    grow with the number of round trips per line item. The caller owns the transaction.
+
+    Rows are locked in ascending id order before they are decremented, so two
+    orders touching the same items always queue on them in the same order and
+    cannot deadlock each other.
+
+    `stats_deltas` is passed on to decrement_stock.
+
+    Returns a mapping of inventory name to {"id", "price", "quantity"} where quantity
+    is the stock left after the decrement.
+    """
+    # Merge repeated lines for the same item so each row is decremented once
+    requested: Dict[str, int] = {}
+    for item in items:
+        requested[item.inventory_name] = requested.get(item.inventory_name, 0) + item.quantity
+
+    if not requested:
+        return {}
+
+    # Resolve and lock every inventory row for this unit in one query
+    statement = (
+        select(Inventory.id, Inventory.name, Inventory.quantity)
+        .where(Inventory.unit_id == unit_id, Inventory.name.in_(list(requested)))
+        .order_by(Inventory.id)
+        .with_for_update()
+    )
+    result = await db.execute(statement)
+    found = {row.name: row for row in result.all()}
+
+    for name in requested:
+        if name not in found:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Inventory item '{name}' does not exist in this business unit.",
+            )
+
+    # Decrement only the rows that still hold enough stock. The rows are locked, so a
+    # request above the current quantity (even one past the integer range) is refused here
+    updated = await decrement_stock(
+        db,
+        {
+            found[name].id: quantity
+            for name, quantity in requested.items()
+            if quantity <= found[name].quantity
+        },
+        stats_deltas,
+    )
+
+    reserved = {}
+    for name in requested:
+        row = updated.get(found[name].id)
+        if row is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Not enough stock for item '{name}'. Available: {found[name].quantity}",
+            )
+        reserved[name] = {"id": row.id, "price": row.price, "quantity": row.quantity}
+
+    return reserved
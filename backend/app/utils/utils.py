@@ -1,10 +1,23 @@
 from passlib.context import CryptContext
 from jwt.exceptions import PyJWTError
 from jose import jwt, JWTError
-from datetime import datetime, timedelta
-from db.session import settings
-from typing import Optional
+from datetime import datetime, timedelta, timezone
+from db.session import settings, get_session
+from db.models import User, RefreshToken
+from schemas.auth import CurrentUser
+from utils.cache import TTLCache
+from typing import List, Optional, Tuple
+from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import event, update, delete
+from sqlalchemy.orm import Session, SessionTransaction, object_session
+from sqlmodel import select
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import base64
+import hashlib
+import secrets
 
 
 
@@ -29,6 +42,117 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+class PasswordHasher:
+    """
+    Runs bcrypt off the event loop on a bounded thread or process pool.
+
+    At most `workers` hashes run at once; further calls wait their turn, and once
+    `max_queue` calls are already waiting new ones are rejected with 503 instead
+    of piling up behind a login storm.
+    """
+
+    def __init__(self, executor: str, workers: int, max_queue: int):
+        self.executor_type = executor
+        self.workers = max(workers, 1)
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.peak_waiting = 0
+        self._semaphore = asyncio.Semaphore(self.workers)
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="password-hasher"
+                )
+        return self._executor
+
+    async def run(self, func, *args):
+        if self.max_queue and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent password checks, please retry",
+            )
+
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    async def map(self, func, items: List) -> List:
+        """
+        Run `func` over every item, keeping at most `workers` calls in flight so a
+        large batch does not fill the wait queue meant for interactive logins.
+        """
+        results = []
+        for start in range(0, len(items), self.workers):
+            batch = items[start:start + self.workers]
+            results.extend(await asyncio.gather(*(self.run(func, item) for item in batch)))
+        return results
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "executor": self.executor_type,
+            "workers": self.workers,
+            "running": self.running,
+            "queue_depth": self.waiting,
+            "peak_queue_depth": self.peak_waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+password_hasher = PasswordHasher(
+    settings.PASSWORD_HASH_EXECUTOR,
+    settings.PASSWORD_HASH_WORKERS,
+    settings.PASSWORD_HASH_MAX_QUEUE,
+)
+
+
+async def hash_password_async(password: str) -> str:
+    """
+    Hash a password on the password hasher pool instead of the event loop.
+    """
+    return await password_hasher.run(hash_password, password)
+
+
+async def hash_passwords_async(passwords: List[str]) -> List[str]:
+    """
+    Hash many passwords in parallel on the password hasher pool.
+    """
+    return await password_hasher.map(hash_password, passwords)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    Verify a password on the password hasher pool instead of the event loop.
+    """
+    return await password_hasher.run(verify_password, plain_password, hashed_password)
+
+
 # Create access token
 def create_access_token(data: dict, expires_delta: timedelta) -> str:
     to_encode = data.copy()
@@ -37,6 +161,51 @@ def create_access_token(data: dict, expires_delta: timedelta) -> str:
     # Use jwt.encode directly
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
+
+# Refresh tokens are random, so a fast hash is enough to store them safely
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def issue_refresh_token(db: AsyncSession, user_id: int) -> str:
+    """
+    Create a refresh token for the user. Only its hash is stored; the caller commits.
+    """
+    token = secrets.token_urlsafe(32)
+    db.add(
+        RefreshToken(
+            user_id=user_id,
+            token_hash=hash_refresh_token(token),
+            expires_at=datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+        )
+    )
+    return token
+
+
+async def revoke_refresh_tokens(db: AsyncSession, user_id: int) -> None:
+    """
+    Revoke every outstanding refresh token of a user; the caller commits.
+    """
+    statement = (
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id, RefreshToken.revoked == False)
+        .values(revoked=True)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(statement)
+
+
+async def purge_expired_refresh_tokens(db: AsyncSession) -> int:
+    """
+    Delete expired refresh tokens. Revoked tokens are kept until they expire, so
+    /refresh can still recognise a rotated token being reused.
+    """
+    statement = delete(RefreshToken).where(RefreshToken.expires_at < datetime.utcnow())
+    result = await db.execute(statement)
+    await db.commit()
+    return result.rowcount
+
+
 # Verify access token
 def verify_access_token(token: str) -> Optional[dict]:
     try:
@@ -45,3 +214,185 @@ def verify_access_token(token: str) -> Optional[dict]:
         return payload  # Decoded token payload
     except JWTError:
         return None
+
+
+# Resolved users keyed on email, so most requests skip the user lookup query
+user_cache = TTLCache(settings.USER_CACHE_SIZE, settings.USER_CACHE_TTL_SECONDS)
+
+# Current token version per user id. Entries expire so that a revocation made by
+# another worker process is picked up within TOKEN_VERSION_TTL_SECONDS.
+token_versions = TTLCache(settings.TOKEN_VERSION_CACHE_SIZE, settings.TOKEN_VERSION_TTL_SECONDS)
+
+
+def build_token_claims(user: User) -> dict:
+    """
+    Claims carried by access tokens, enough to authorize without a user lookup.
+    """
+    return {
+        "sub": user.email,
+        "uid": user.id,
+        "role": user.role,
+        "unit_id": user.unit_id,
+        "ver": user.token_version,
+    }
+
+
+def revoke_user_tokens(user: User) -> None:
+    """
+    Invalidate every access token issued to `user` so far. Takes effect once the
+    caller commits the bumped version; `token_versions` is updated only then, so a
+    rolled back revocation never rejects tokens that are still valid.
+    """
+    user.token_version += 1
+    session = object_session(user)
+    if session is None:
+        return
+    transaction = session.get_nested_transaction() or session.get_transaction()
+    session.info.setdefault("token_versions", []).append((transaction, user.id, user.token_version))
+
+
+@event.listens_for(Session, "after_commit")
+def _cache_token_versions(session: Session) -> None:
+    # Releasing a SAVEPOINT also fires after_commit; wait for the real commit
+    if session.in_nested_transaction():
+        return
+    for _, user_id, version in session.info.pop("token_versions", []):
+        token_versions.set(user_id, version)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_token_versions(session: Session, previous_transaction: SessionTransaction) -> None:
+    versions = session.info.get("token_versions")
+    if not versions:
+        return
+    if not previous_transaction.nested:
+        session.info.pop("token_versions", None)
+        return
+
+    def within(transaction: Optional[SessionTransaction]) -> bool:
+        while transaction is not None:
+            if transaction is previous_transaction:
+                return True
+            transaction = transaction.parent
+        return False
+
+    session.info["token_versions"] = [entry for entry in versions if not within(entry[0])]
+
+
+async def verify_token_claims(token: str, db: AsyncSession) -> dict:
+    """
+    Decode the access token and check its version against the user's current one.
+    The version is read from `token_versions`, so usually no query is made.
+    """
+    payload = verify_access_token(token)
+    if not payload:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token"
+        )
+
+    # Tokens issued before versioning carry no uid; they expire on their own
+    uid = payload.get("uid")
+    if uid is None:
+        return payload
+
+    current_version = token_versions.get(uid)
+    if current_version is None:
+        statement = select(User.token_version).where(User.id == uid)
+        result = await db.execute(statement)
+        current_version = result.scalar()
+        if current_version is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token"
+            )
+        token_versions.set(uid, current_version)
+
+    if payload.get("ver", 0) != current_version:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has been revoked"
+        )
+
+    return payload
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme_user),
+    db: AsyncSession = Depends(get_session),
+) -> CurrentUser:
+    """
+    Dependency that resolves the current user from the access token.
+    The user row is served from `user_cache` when possible.
+    """
+    payload = await verify_token_claims(token, db)
+
+    email = payload.get("sub")
+    current_user = user_cache.get(email)
+    if current_user is None:
+        statement = select(User).where(User.email == email)
+        result = await db.execute(statement)
+        user = result.scalars().first()
+
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+            )
+
+        current_user = CurrentUser.model_validate(user)
+        user_cache.set(email, current_user)
+
+    return current_user
+
+
+async def get_token_user(
+    token: str = Depends(oauth2_scheme_user),
+    db: AsyncSession = Depends(get_session),
+) -> CurrentUser:
+    """
+    Dependency for read-only endpoints: builds the current user from the token's
+    claims alone, so authorization needs no database query. Tokens issued before
+    claims were added fall back to get_current_user.
+    """
+    payload = await verify_token_claims(token, db)
+    if payload.get("uid") is None:
+        return await get_current_user(token, db)
+
+    return CurrentUser(
+        id=payload["uid"],
+        email=payload["sub"],
+        role=payload["role"],
+        unit_id=payload.get("unit_id"),
+    )
+
+
+def invalidate_cached_user(*emails: str) -> None:
+    """
+    Drop users from the cache after their row changes.
+    """
+    for email in emails:
+        user_cache.pop(email)
+
+
+def to_naive_utc(value: datetime) -> datetime:
+    """
+    Convert a timezone-aware datetime to the naive UTC the created_at columns store.
+    Naive values are taken to be UTC already and are returned unchanged.
+    """
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+# Keyset pagination cursors: an opaque encoding of the last row's (created_at, id)
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return to_naive_utc(datetime.fromisoformat(created_at)), int(row_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor",
+        )
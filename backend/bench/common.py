@@ -0,0 +1,154 @@
+"""
+Shared setup for the benchmark scripts in this directory.
+
+Each script runs the app in-process against the Postgres named by
+BENCH_DATABASE_URL, whose public schema is dropped and recreated first, so
+never point it at a database you want to keep. Pass `--app` to benchmark
+another checkout, e.g. the code before a change:
+
+    git worktree add /tmp/before <commit>
+    BENCH_DATABASE_URL=... python bench/place_order.py --app /tmp/before/backend/app
+"""
+from types import SimpleNamespace
+import argparse
+import os
+import statistics
+import sys
+
+DEFAULT_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+
+def parse_args(description: str, **options) -> argparse.Namespace:
+    """
+    Parse `--app` plus the script's own `options` ({name: default}), then point
+    the settings and imports at that app.
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--app", default=DEFAULT_APP, help="backend/app directory to benchmark")
+    for name, default in options.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(default), default=default)
+    args = parser.parse_args()
+
+    url = os.environ.get("BENCH_DATABASE_URL")
+    if not url:
+        parser.error("BENCH_DATABASE_URL must name a scratch database")
+    # Settings are read on import, so they must be in place before the app is
+    os.environ["DATABASE_URL"] = url
+    for name, value in {
+        "DB_USER": "bench",
+        "DB_PASSWORD": "bench",
+        "DB_HOST": "localhost",
+        "DB_NAME": "bench",
+        "SECRET_KEY": "bench-secret",
+        "ALGORITHM": "HS256",
+        "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+        "ADMIN_NAME": "admin",
+        "ADMIN_EMAIL": "admin@example.com",
+        "ADMIN_PASSWORD": "adminpass",
+    }.items():
+        os.environ.setdefault(name, value)
+    sys.path.insert(0, os.path.abspath(args.app))
+    return args
+
+
+def percentiles(samples) -> str:
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"p50 {p50 * 1000:8.2f} ms  p99 {p99 * 1000:8.2f} ms  n={len(samples)}"
+
+
+class BenchApp:
+    """
+    Async context manager yielding a started app over an empty schema, with an
+    admin, one business unit and helpers to add inventory and users.
+    """
+
+    async def __aenter__(self) -> SimpleNamespace:
+        from httpx import ASGITransport, AsyncClient
+        from sqlalchemy import text
+        from db.session import engine
+        import main
+
+        engine.echo = False
+        async with engine.begin() as conn:
+            await conn.execute(text("DROP SCHEMA public CASCADE"))
+            await conn.execute(text("CREATE SCHEMA public"))
+
+        self.lifespan = main.lifespan(main.app)
+        await self.lifespan.__aenter__()
+        self.client = AsyncClient(
+            transport=ASGITransport(app=main.app), base_url="http://bench", timeout=None
+        )
+        client = self.client
+
+        response = await client.post(
+            "/auth/admin/login",
+            data={"username": os.environ["ADMIN_NAME"], "password": os.environ["ADMIN_PASSWORD"]},
+        )
+        response.raise_for_status()
+        admin = {"Authorization": "Bearer " + response.json()["access_token"]}
+
+        response = await client.post(
+            "/auth/admin/create-business-unit", json={"name": "Bench", "location": "Here"}, headers=admin
+        )
+        response.raise_for_status()
+        unit_id = response.json()["id"]
+
+        async def create_inventory(name: str, quantity: int, reorder_level: int = 0, price: float = 1.0):
+            response = await client.post(
+                "/auth/admin/create-inventory",
+                json={"unit_id": unit_id, "name": name, "quantity": quantity, "reorder_level": reorder_level, "price": price},
+                headers=admin,
+            )
+            response.raise_for_status()
+            return response.json()
+
+        async def create_employee(index: int) -> dict:
+            email = f"employee{index}@example.com"
+            response = await client.post(
+                "/auth/admin/create-employee",
+                json={"name": f"employee{index}", "email": email, "password": "password1", "unit_id": unit_id},
+                headers=admin,
+            )
+            response.raise_for_status()
+            return await login(email)
+
+        # Customers cannot sign up through the API, so they are inserted directly
+        async def create_customer(index: int) -> dict:
+            from utils.utils import hash_password
+
+            email = f"customer{index}@example.com"
+            async with engine.begin() as conn:
+                await conn.execute(
+                    text(
+                        'INSERT INTO "user" (name, email, role, password_hash, created_at) '
+                        "VALUES (:name, :email, 'customer', :password_hash, now())"
+                    ),
+                    {"name": f"customer{index}", "email": email, "password_hash": hash_password("password1")},
+                )
+            return await login(email)
+
+        async def login(email: str) -> dict:
+            response = await client.post("/auth/login", json={"email": email, "password": "password1"})
+            response.raise_for_status()
+            return {"Authorization": "Bearer " + response.json()["access_token"]}
+
+        return SimpleNamespace(
+            app=main.app,
+            client=client,
+            admin=admin,
+            unit_id=unit_id,
+            unit_name="Bench",
+            create_inventory=create_inventory,
+            create_employee=create_employee,
+            create_customer=create_customer,
+            login=login,
+        )
+
+    async def __aexit__(self, *exc_info) -> None:
+        from db.session import engine
+
+        await self.client.aclose()
+        await self.lifespan.__aexit__(*exc_info)
+        await engine.dispose()
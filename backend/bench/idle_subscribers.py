@@ -0,0 +1,126 @@
+"""
+Load test for GET /notifications/stream with thousands of idle subscribers.
+
+Opens `subscribers` SSE streams on one worker, half as admins and half as unit
+employees, and reports the memory each one holds, how long a low-stock event
+takes to reach all of them, and the latency of a regular endpoint while they
+are connected.
+
+    BENCH_DATABASE_URL=... python bench/idle_subscribers.py --subscribers 5000
+"""
+import asyncio
+import time
+import tracemalloc
+
+from common import BenchApp, parse_args, percentiles
+
+
+def open_stream(app, token: str) -> dict:
+    """
+    Drive the ASGI app directly, since httpx buffers whole responses in-process.
+    Every event frame is recorded with the time it arrived.
+    """
+    stream = {"frames": [], "status": None, "closed": asyncio.Event()}
+    query = f"token={token}"
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/notifications/stream",
+        "raw_path": b"/notifications/stream",
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [],
+        "client": ("bench", 1),
+        "server": ("bench", 80),
+    }
+
+    async def receive():
+        await stream["closed"].wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            stream["status"] = message["status"]
+        elif message.get("body") and not message["body"].startswith(b":"):
+            # Keepalive comments are not events
+            stream["frames"].append((time.perf_counter(), message["body"]))
+
+    stream["task"] = asyncio.create_task(app(scope, receive, send))
+    return stream
+
+
+async def probe(bench, headers: dict, count: int) -> list:
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        response = await bench.client.get("/inventory/", headers=headers)
+        samples.append(time.perf_counter() - started)
+        response.raise_for_status()
+    return samples
+
+
+async def main(args) -> None:
+    from utils.feed import notification_feed
+
+    async with BenchApp() as bench:
+        item = await bench.create_inventory("widget", 1_000_000, reorder_level=100)
+        employee = await bench.create_employee(0)
+        customer = await bench.create_customer(0)
+        tokens = [bench.admin["Authorization"][7:], employee["Authorization"][7:]]
+
+        print(f"no subscribers:    GET /inventory/ {percentiles(await probe(bench, employee, args.probes))}")
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        streams = [open_stream(bench.app, tokens[index % 2]) for index in range(args.subscribers)]
+        while notification_feed.stats()["subscribers"] < args.subscribers:
+            await asyncio.sleep(0.1)
+        connect_time = time.perf_counter() - started
+        held = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        print(
+            f"{args.subscribers} subscribers:  connected in {connect_time:.2f} s, "
+            f"{held / args.subscribers / 1024:.1f} KiB each"
+        )
+
+        print(f"idle subscribers:  GET /inventory/ {percentiles(await probe(bench, employee, args.probes))}")
+
+        # Each round opens a notification with an order and resolves it with a restock
+        delivery = []
+        for _ in range(args.rounds):
+            for request in (
+                lambda: bench.client.post(
+                    "/orders/place-order",
+                    json={
+                        "unit_name": bench.unit_name,
+                        "order_type": "takeaway",
+                        "items": [{"inventory_name": "widget", "quantity": 1_000_000 - 50}],
+                    },
+                    headers=customer,
+                ),
+                lambda: bench.client.put(
+                    f"/inventory/{item['id']}", json={"quantity": 1_000_000}, headers=bench.admin
+                ),
+            ):
+                seen = [len(stream["frames"]) for stream in streams]
+                started = time.perf_counter()
+                response = await request()
+                response.raise_for_status()
+                while any(len(stream["frames"]) == count for stream, count in zip(streams, seen)):
+                    await asyncio.sleep(0.01)
+                delivery.extend(stream["frames"][count][0] - started for stream, count in zip(streams, seen))
+
+        print(f"event delivery:    {percentiles(delivery)}")
+
+        for stream in streams:
+            stream["closed"].set()
+        await asyncio.gather(*[stream["task"] for stream in streams])
+        print(f"after disconnect:  {notification_feed.stats()}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args(__doc__, subscribers=5000, rounds=5, probes=200)))
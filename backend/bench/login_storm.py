@@ -0,0 +1,61 @@
+"""
+Latency of a non-auth endpoint (GET /inventory/) while a storm of logins runs.
+
+Probes are sent one after another for `seconds`, first on a quiet app and then
+while `logins` concurrent clients log in back to back, so the difference shows
+how much password hashing stalls everything else.
+
+    BENCH_DATABASE_URL=... python bench/login_storm.py --logins 16 --seconds 10
+"""
+import asyncio
+import time
+
+from common import BenchApp, parse_args, percentiles
+
+
+async def main(args) -> None:
+    async with BenchApp() as bench:
+        for index in range(10):
+            await bench.create_inventory(f"item{index}", 100)
+        employee = await bench.create_employee(0)
+        for index in range(args.logins):
+            await bench.create_customer(index)
+
+        async def probe() -> list:
+            samples = []
+            deadline = time.perf_counter() + args.seconds
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = await bench.client.get("/inventory/", headers=employee)
+                samples.append(time.perf_counter() - started)
+                response.raise_for_status()
+            return samples
+
+        print(f"quiet:       {percentiles(await probe())}")
+
+        stop = asyncio.Event()
+        logins = []
+
+        async def storm(index: int) -> None:
+            while not stop.is_set():
+                started = time.perf_counter()
+                response = await bench.client.post(
+                    "/auth/login", json={"email": f"customer{index}@example.com", "password": "password1"}
+                )
+                logins.append(time.perf_counter() - started)
+                response.raise_for_status()
+
+        storm_tasks = [asyncio.create_task(storm(index)) for index in range(args.logins)]
+        await asyncio.sleep(0.5)
+        started = time.perf_counter()
+        samples = await probe()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await asyncio.gather(*storm_tasks)
+
+        print(f"login storm: {percentiles(samples)}")
+        print(f"logins:      {percentiles(logins)}  ({len(logins) / elapsed:.1f}/s)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args(__doc__, logins=16, seconds=10.0)))
@@ -0,0 +1,47 @@
+"""
+Latency of POST /orders/place-order by basket size.
+
+Several customers place orders concurrently; every order takes one unit of each
+of the first `size` items, so larger baskets touch more inventory rows.
+
+    BENCH_DATABASE_URL=... python bench/place_order.py --sizes 1,5,10,30
+"""
+import asyncio
+import time
+
+from common import BenchApp, parse_args, percentiles
+
+
+async def main(args) -> None:
+    sizes = [int(size) for size in args.sizes.split(",")]
+    async with BenchApp() as bench:
+        names = [f"item{index:02d}" for index in range(max(sizes))]
+        for name in names:
+            await bench.create_inventory(name, 10_000_000, price=2.5)
+        customers = [await bench.create_customer(index) for index in range(args.concurrency)]
+
+        for size in sizes:
+            body = {
+                "unit_name": bench.unit_name,
+                "order_type": "takeaway",
+                "items": [{"inventory_name": name, "quantity": 1} for name in names[:size]],
+            }
+            samples = []
+
+            async def customer_loop(headers: dict, count: int) -> None:
+                for _ in range(count):
+                    started = time.perf_counter()
+                    response = await bench.client.post("/orders/place-order", json=body, headers=headers)
+                    samples.append(time.perf_counter() - started)
+                    response.raise_for_status()
+
+            per_customer = max(args.requests // args.concurrency, 1)
+            # Warm up connections and caches before measuring
+            await asyncio.gather(*[customer_loop(headers, 2) for headers in customers])
+            samples.clear()
+            await asyncio.gather(*[customer_loop(headers, per_customer) for headers in customers])
+            print(f"basket {size:3d} items: {percentiles(samples)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args(__doc__, sizes="1,5,10,30", requests=400, concurrency=8)))
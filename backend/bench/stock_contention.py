@@ -0,0 +1,69 @@
+"""
+Throughput of POST /orders/place-order when every order contends for the same rows.
+
+Runs the same load directly and through group commit. Each run places `orders`
+single-item orders from `concurrency` customers against one hot item, plus a
+basket that also takes a second item, and checks that no more stock was sold
+than there was.
+
+    BENCH_DATABASE_URL=... python bench/stock_contention.py --orders 2000
+"""
+import asyncio
+import time
+
+from common import BenchApp, parse_args, percentiles
+
+
+async def run(args, group_commit: bool) -> None:
+    from core.config import settings
+
+    # Read by the lifespan when it decides whether to start the order writer
+    settings.ORDER_GROUP_COMMIT = group_commit
+    async with BenchApp() as bench:
+        await bench.create_inventory("hot", args.stock)
+        await bench.create_inventory("side", args.stock)
+        customers = [await bench.create_customer(index) for index in range(args.concurrency)]
+        baskets = [[("hot", 1)], [("side", 1), ("hot", 1)]]
+        samples = []
+        placed = 0
+
+        async def customer_loop(index: int) -> None:
+            nonlocal placed
+            headers = customers[index]
+            for number in range(args.orders // args.concurrency):
+                basket = baskets[(index + number) % len(baskets)]
+                started = time.perf_counter()
+                response = await bench.client.post(
+                    "/orders/place-order",
+                    json={
+                        "unit_name": bench.unit_name,
+                        "order_type": "takeaway",
+                        "items": [{"inventory_name": name, "quantity": quantity} for name, quantity in basket],
+                    },
+                    headers=headers,
+                )
+                samples.append(time.perf_counter() - started)
+                if response.status_code == 200:
+                    placed += 1
+                elif response.status_code != 400:
+                    response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*[customer_loop(index) for index in range(args.concurrency)])
+        elapsed = time.perf_counter() - started
+
+        response = await bench.client.get("/inventory/", headers=bench.admin)
+        left = {item["name"]: item["quantity"] for item in response.json()}
+        assert left["hot"] >= 0 and left["hot"] == args.stock - placed, (left, placed)
+
+        mode = "group commit" if group_commit else "direct"
+        print(f"{mode:12s}: {placed / elapsed:8.1f} orders/s  {percentiles(samples)}  ({placed} placed)")
+
+
+async def main(args) -> None:
+    for group_commit in (False, True):
+        await run(args, group_commit)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args(__doc__, orders=2000, stock=1_000_000, concurrency=32)))
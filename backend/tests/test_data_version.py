@@ -0,0 +1,96 @@
+"""
+Conditional GETs: ETags follow the caller's unit data version, and an unchanged
+resource is answered with 304.
+"""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_employee(client, seed, index: int, unit_id: int) -> dict:
+    email = f"employee{index}@example.com"
+    response = await client.post(
+        "/auth/admin/create-employee",
+        json={"name": f"employee{index}", "email": email, "password": "password1", "unit_id": unit_id},
+        headers=seed.admin,
+    )
+    assert response.status_code == 200, response.text
+    response = await client.post("/auth/login", json={"email": email, "password": "password1"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": "Bearer " + response.json()["access_token"]}
+
+
+async def etag(client, headers) -> str:
+    response = await client.get("/inventory/", headers=headers)
+    assert response.status_code == 200, response.text
+    return response.headers["ETag"]
+
+
+async def set_quantity(client, seed, item: dict, quantity: int) -> None:
+    response = await client.put(f"/inventory/{item['id']}", json={"quantity": quantity}, headers=seed.admin)
+    assert response.status_code == 200, response.text
+
+
+async def test_repeated_get_is_not_modified(client, seed):
+    await seed.create_inventory("apple", 10)
+    employee = await create_employee(client, seed, 0, seed.unit_id)
+
+    for headers in (employee, seed.admin):
+        tag = await etag(client, headers)
+        response = await client.get("/inventory/", headers={**headers, "If-None-Match": tag})
+        assert response.status_code == 304, response.text
+        assert response.headers["ETag"] == tag
+
+
+async def test_write_in_the_unit_changes_the_etag(client, seed):
+    item = await seed.create_inventory("apple", 10)
+    employee = await create_employee(client, seed, 0, seed.unit_id)
+    before = {"employee": await etag(client, employee), "admin": await etag(client, seed.admin)}
+
+    await set_quantity(client, seed, item, 20)
+
+    assert await etag(client, employee) != before["employee"]
+    assert await etag(client, seed.admin) != before["admin"]
+    response = await client.get("/inventory/", headers={**employee, "If-None-Match": before["employee"]})
+    assert response.status_code == 200, response.text
+
+
+async def test_write_in_another_unit_keeps_the_employee_etag(client, seed):
+    response = await client.post(
+        "/auth/admin/create-business-unit", json={"name": "Unit 2", "location": "There"}, headers=seed.admin
+    )
+    assert response.status_code == 200, response.text
+    other_unit_id = response.json()["id"]
+
+    await seed.create_inventory("apple", 10)
+    other_item = await seed.create_inventory("pear", 10, unit=other_unit_id)
+    employee = await create_employee(client, seed, 0, seed.unit_id)
+    before = {"employee": await etag(client, employee), "admin": await etag(client, seed.admin)}
+
+    await set_quantity(client, seed, other_item, 20)
+
+    assert await etag(client, employee) == before["employee"]
+    # Admins see every unit, so their ETag does change
+    assert await etag(client, seed.admin) != before["admin"]
+
+
+async def test_group_commit_order_changes_the_etag(client, seed, monkeypatch):
+    from core.config import settings
+    from utils.orders import order_writer
+
+    # The writer normally starts with the app; the lifespan stops it
+    monkeypatch.setattr(settings, "ORDER_GROUP_COMMIT", True)
+    order_writer.start()
+
+    await seed.create_inventory("apple", 10)
+    customer = await seed.create_customer(0)
+    employee = await create_employee(client, seed, 0, seed.unit_id)
+    before = await etag(client, employee)
+
+    response = await client.post(
+        "/orders/place-order",
+        json={"unit_name": seed.unit_name, "order_type": "takeaway", "items": [{"inventory_name": "apple", "quantity": 1}]},
+        headers=customer,
+    )
+    assert response.status_code == 200, response.text
+    assert await etag(client, employee) != before
@@ -0,0 +1,35 @@
+"""
+Bulk employee provisioning holds no database connection while it hashes passwords.
+"""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_no_connection_is_held_while_hashing(client, seed, monkeypatch):
+    from db.session import engine
+    import utils.employees
+
+    hash_passwords_async = utils.employees.hash_passwords_async
+    checked_out = []
+
+    async def hash_and_count(passwords):
+        checked_out.append(engine.pool.checkedout())
+        return await hash_passwords_async(passwords)
+
+    monkeypatch.setattr(utils.employees, "hash_passwords_async", hash_and_count)
+    idle = engine.pool.checkedout()
+
+    response = await client.post(
+        "/auth/admin/create-employees-bulk",
+        json=[
+            {"name": f"employee{index}", "email": f"employee{index}@example.com",
+             "password": "password1", "gender": "female", "unit_id": seed.unit_id}
+            for index in range(3)
+        ],
+        headers=seed.admin,
+    )
+    assert response.status_code == 200, response.text
+    assert len(response.json()["created"]) == 3
+    assert response.json()["errors"] == []
+    assert checked_out == [idle]
@@ -0,0 +1,74 @@
+"""
+Idempotency-Keys under group commit: repeats within a batch get the same order,
+and a batch that fails leaves nothing behind for retries to replay.
+"""
+import asyncio
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def group_commit(monkeypatch):
+    from core.config import settings
+
+    monkeypatch.setattr(settings, "ORDER_GROUP_COMMIT", True)
+
+
+def order_body(unit_name):
+    return {
+        "unit_name": unit_name,
+        "order_type": "takeaway",
+        "items": [{"inventory_name": "apple", "quantity": 1}],
+    }
+
+
+async def order_count():
+    from sqlalchemy import func, select
+    from db.models import Order
+    from db.session import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(func.count(Order.id)))).scalar_one()
+
+
+async def test_repeated_key_in_one_batch_places_one_order(group_commit, client, seed):
+    await seed.create_inventory("apple", 100)
+    customer = await seed.create_customer(0)
+    headers = {**customer, "Idempotency-Key": "same-key"}
+
+    responses = await asyncio.gather(*[
+        client.post("/orders/place-order", json=order_body(seed.unit_name), headers=headers)
+        for _ in range(5)
+    ])
+
+    assert [response.status_code for response in responses] == [200] * 5
+    assert len({response.json()["id"] for response in responses}) == 1
+    assert await order_count() == 1
+
+
+async def test_failed_batch_is_not_replayed(group_commit, client, seed, monkeypatch):
+    import utils.orders
+
+    await seed.create_inventory("apple", 100)
+    customer = await seed.create_customer(0)
+    headers = {**customer, "Idempotency-Key": "retry-key"}
+
+    async def failing_record_sales(db, orders):
+        raise RuntimeError("commit failed")
+
+    # Both requests land in one batch: the second finds the first's uncommitted order
+    with monkeypatch.context() as patch:
+        patch.setattr(utils.orders, "record_sales", failing_record_sales)
+        responses = await asyncio.gather(*[
+            client.post("/orders/place-order", json=order_body(seed.unit_name), headers=headers)
+            for _ in range(2)
+        ], return_exceptions=True)
+    assert all(isinstance(response, RuntimeError) for response in responses)
+    assert await order_count() == 0
+
+    # A retry places the order instead of replaying one that was never committed
+    response = await client.post("/orders/place-order", json=order_body(seed.unit_name), headers=headers)
+    assert response.status_code == 200, response.text
+    assert await order_count() == 1
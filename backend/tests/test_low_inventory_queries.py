@@ -0,0 +1,52 @@
+"""
+The low-inventory listing loads every open notification with its item, unit and
+employee count in one query.
+"""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_low_inventory_query_count_is_constant(client, seed, count_queries):
+    await seed.create_inventory("apple", 2, reorder_level=10)
+    await seed.create_inventory("pear", 50, reorder_level=10)
+
+    with count_queries() as few:
+        response = await client.get("/notifications/low-inventory", headers=seed.admin)
+    assert response.status_code == 200, response.text
+    assert [item["inventory_item_name"] for item in response.json()] == ["apple"]
+
+    # More units, employees and low items must not add queries
+    for index in range(3):
+        response = await client.post(
+            "/auth/admin/create-business-unit",
+            json={"name": f"Unit {index + 2}", "location": "There"},
+            headers=seed.admin,
+        )
+        assert response.status_code == 200, response.text
+        unit_id = response.json()["id"]
+        response = await client.post(
+            "/auth/admin/create-employee",
+            json={
+                "name": f"emp{index}",
+                "email": f"emp{index}@example.com",
+                "password": "password1",
+                "unit_id": unit_id,
+            },
+            headers=seed.admin,
+        )
+        assert response.status_code == 200, response.text
+        for name in ("fig", "plum"):
+            await seed.create_inventory(name, 1, reorder_level=5, unit=unit_id)
+
+    with count_queries() as many:
+        response = await client.get("/notifications/low-inventory", headers=seed.admin)
+    assert response.status_code == 200, response.text
+    notifications = response.json()
+    assert len(notifications) == 7
+    assert {(item["business_unit_name"], item["total_employees"]) for item in notifications} == {
+        ("Unit 1", 0), ("Unit 2", 1), ("Unit 3", 1), ("Unit 4", 1)
+    }
+
+    assert len(few) == 1, few
+    assert len(many) == 1, many
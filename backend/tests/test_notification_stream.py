@@ -0,0 +1,100 @@
+"""
+A client reconnecting to GET /notifications/stream with Last-Event-ID receives
+the events it missed from the replay buffer.
+"""
+import asyncio
+import json
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+def open_stream(app, token: str, last_event_id=None) -> dict:
+    """
+    Drive the ASGI app directly, since httpx buffers whole responses in-process.
+    """
+    stream = {"frames": [], "closed": asyncio.Event()}
+    headers = [(b"last-event-id", last_event_id.encode())] if last_event_id else []
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/notifications/stream",
+        "raw_path": b"/notifications/stream",
+        "root_path": "",
+        "query_string": f"token={token}".encode(),
+        "headers": headers,
+        "client": ("test", 1),
+        "server": ("test", 80),
+    }
+
+    async def receive():
+        await stream["closed"].wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message.get("body") and not message["body"].startswith(b":"):
+            stream["frames"].append(message["body"].decode())
+
+    stream["task"] = asyncio.create_task(app(scope, receive, send))
+    return stream
+
+
+async def frames(stream: dict, count: int) -> list:
+    async def wait():
+        while len(stream["frames"]) < count:
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(wait(), timeout=5)
+    return stream["frames"]
+
+
+async def close(stream: dict) -> None:
+    stream["closed"].set()
+    await stream["task"]
+
+
+def parse(frame: str) -> dict:
+    fields = dict(line.split(": ", 1) for line in frame.strip().splitlines())
+    return {"id": fields.get("id"), "event": fields.get("event"), "data": json.loads(fields["data"])}
+
+
+async def set_quantity(client, seed, item: dict, quantity: int) -> None:
+    response = await client.put(f"/inventory/{item['id']}", json={"quantity": quantity}, headers=seed.admin)
+    assert response.status_code == 200, response.text
+
+
+async def test_reconnect_replays_missed_events(client, seed):
+    import main
+    from utils.feed import notification_feed
+
+    item = await seed.create_inventory("widget", 50, reorder_level=10)
+    token = seed.admin["Authorization"][7:]
+
+    stream = open_stream(main.app, token)
+    while notification_feed.stats()["subscribers"] < 1:
+        await asyncio.sleep(0.01)
+    await set_quantity(client, seed, item, 5)
+    first = parse((await frames(stream, 1))[0])
+    assert first["data"]["type"] == "opened"
+    await close(stream)
+
+    # Missed while disconnected
+    await set_quantity(client, seed, item, 50)
+    await set_quantity(client, seed, item, 3)
+
+    stream = open_stream(main.app, token, last_event_id=first["id"])
+    missed = [parse(frame) for frame in await frames(stream, 2)]
+    await close(stream)
+    assert [event["data"]["type"] for event in missed] == ["resolved", "opened"]
+    assert all(event["data"]["unit_id"] == seed.unit_id for event in missed)
+    assert len({first["id"], *(event["id"] for event in missed)}) == 3
+
+    # An id this process never issued cannot be replayed
+    stream = open_stream(main.app, token, last_event_id="unknown-1")
+    reload = parse((await frames(stream, 1))[0])
+    await close(stream)
+    assert reload["event"] == "reload"
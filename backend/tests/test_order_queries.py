@@ -0,0 +1,84 @@
+"""
+Order reads load their items with a fixed number of queries, however many
+orders and items there are.
+"""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def place_orders(client, seed, customer, count):
+    for _ in range(count):
+        response = await client.post(
+            "/orders/place-order",
+            json={
+                "unit_name": seed.unit_name,
+                "order_type": "dine-in",
+                "items": [
+                    {"inventory_name": "apple", "quantity": 1},
+                    {"inventory_name": "pear", "quantity": 2},
+                    {"inventory_name": "fig", "quantity": 1},
+                ],
+            },
+            headers=customer,
+        )
+        assert response.status_code == 200, response.text
+        order_id = response.json()["id"]
+    return order_id
+
+
+async def test_order_page_with_items_query_count_is_constant(client, seed, count_queries):
+    for name in ("apple", "pear", "fig"):
+        await seed.create_inventory(name, 1000)
+    customer = await seed.create_customer(0)
+
+    await place_orders(client, seed, customer, 2)
+    with count_queries() as few:
+        response = await client.get("/orders/list-orders-with-items", headers=seed.admin)
+    assert response.status_code == 200, response.text
+    assert len(response.json()["items"]) == 2
+
+    await place_orders(client, seed, customer, 20)
+    with count_queries() as many:
+        response = await client.get("/orders/list-orders-with-items", headers=seed.admin)
+    assert response.status_code == 200, response.text
+    page = response.json()["items"]
+    assert len(page) == 22
+    assert all(len(order["items"]) == 3 for order in page)
+
+    assert len(many) == len(few), many
+    # The page, then every item with its inventory row in one SELECT ... IN
+    assert len(many) == 2, many
+
+
+async def test_order_detail_query_count(client, seed, count_queries):
+    for name in ("apple", "pear", "fig"):
+        await seed.create_inventory(name, 1000)
+    customer = await seed.create_customer(0)
+    order_id = await place_orders(client, seed, customer, 3)
+
+    with count_queries() as statements:
+        response = await client.get(f"/orders/{order_id}", headers=customer)
+    assert response.status_code == 200, response.text
+    assert [item["quantity"] for item in response.json()["items"]] == [1, 2, 1]
+
+    assert len(statements) == 2, statements
+
+
+@pytest.mark.parametrize("path", ["/orders/list-orders", "/orders/list-orders-with-items"])
+async def test_order_listing_accepts_aware_date_filters(client, seed, path):
+    for name in ("apple", "pear", "fig"):
+        await seed.create_inventory(name, 1000)
+    customer = await seed.create_customer(0)
+    await place_orders(client, seed, customer, 2)
+
+    # The orders were placed just now, in UTC; +02:00 moves the bound two hours back
+    response = await client.get(
+        path, params={"start": "2000-01-01T00:00:00Z", "end": "2999-01-01T00:00:00+02:00"}, headers=seed.admin
+    )
+    assert response.status_code == 200, response.text
+    assert len(response.json()["items"]) == 2
+
+    response = await client.get(path, params={"start": "2999-01-01T00:00:00Z"}, headers=seed.admin)
+    assert response.status_code == 200, response.text
+    assert response.json()["items"] == []
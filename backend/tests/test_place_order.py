@@ -0,0 +1,46 @@
+"""
+Placing an order with no items is accepted, as it always was, on every path.
+"""
+import json
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(params=[False, True], ids=["direct", "group-commit"])
+def group_commit(request, monkeypatch):
+    from core.config import settings
+
+    monkeypatch.setattr(settings, "ORDER_GROUP_COMMIT", request.param)
+    return request.param
+
+
+async def test_empty_order_is_placed(group_commit, client, seed):
+    customer = await seed.create_customer(0)
+
+    response = await client.post(
+        "/orders/place-order",
+        json={"unit_name": seed.unit_name, "order_type": "takeaway", "items": []},
+        headers=customer,
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["total_amount"] == 0
+
+    response = await client.get(f"/orders/{response.json()['id']}", headers=customer)
+    assert response.status_code == 200, response.text
+    assert response.json()["items"] == []
+
+
+async def test_empty_orders_in_bulk_import(client, seed):
+    customer = await seed.create_customer(0)
+    record = {"unit_name": seed.unit_name, "order_type": "takeaway", "items": []}
+
+    response = await client.post(
+        "/orders/bulk",
+        content="\n".join(json.dumps(record) for _ in range(2)),
+        headers=customer,
+    )
+    assert response.status_code == 200, response.text
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [result["status"] for result in results] == ["created", "created"]
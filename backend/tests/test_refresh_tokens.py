@@ -0,0 +1,37 @@
+"""
+Reusing a rotated refresh token ends every session of its user, also after the
+periodic purge has run.
+"""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def refresh(client, token: str):
+    return await client.post("/auth/refresh", json={"refresh_token": token})
+
+
+async def test_reuse_after_purge_revokes_all_sessions(client, seed):
+    from db.session import AsyncSessionLocal
+    from utils.utils import purge_expired_refresh_tokens
+
+    await seed.create_customer(0)
+    response = await client.post(
+        "/auth/login", json={"email": "customer0@example.com", "password": "password1"}
+    )
+    assert response.status_code == 200, response.text
+    first = response.json()["refresh_token"]
+
+    response = await refresh(client, first)
+    assert response.status_code == 200, response.text
+    second = response.json()["refresh_token"]
+
+    async with AsyncSessionLocal() as db:
+        await purge_expired_refresh_tokens(db)
+
+    response = await refresh(client, first)
+    assert response.status_code == 401, response.text
+    assert response.json()["detail"] == "Refresh token has already been used"
+
+    response = await refresh(client, second)
+    assert response.status_code == 401, response.text
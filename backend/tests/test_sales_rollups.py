@@ -0,0 +1,139 @@
+"""
+The financial reports, read from the incrementally maintained daily rollups,
+match the order history however the orders were placed: directly, through the
+group-commit writer (including orders that fail inside a batch) or in bulk.
+"""
+import asyncio
+import json
+from datetime import timedelta
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def group_commit(monkeypatch):
+    from core.config import settings
+
+    # The writer is started with the app, so the flag must be on before `client`
+    monkeypatch.setattr(settings, "ORDER_GROUP_COMMIT", True)
+
+
+def basket(unit_name, *items):
+    return {
+        "unit_name": unit_name,
+        "order_type": "takeaway",
+        "items": [{"inventory_name": name, "quantity": quantity} for name, quantity in items],
+    }
+
+
+async def history() -> dict:
+    """
+    The reports computed straight from Order and OrderItem.
+    """
+    from sqlalchemy import Date, cast, func, select
+    from db.models import Inventory, Order, OrderItem, User
+    from db.session import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        total_sales, order_count = (
+            await db.execute(select(func.sum(Order.total_amount), func.count(Order.id)))
+        ).one()
+        revenue = await db.execute(
+            select(Inventory.name, func.sum(OrderItem.quantity * OrderItem.price))
+            .join(Inventory, Inventory.id == OrderItem.inventory_id)
+            .group_by(Inventory.name)
+        )
+        spent = await db.execute(
+            select(User.name, func.sum(Order.total_amount))
+            .join(User, User.id == Order.user_id)
+            .group_by(User.name)
+        )
+        days = await db.execute(
+            select(cast(Order.created_at, Date), func.sum(Order.total_amount), func.count(Order.id))
+            .group_by(cast(Order.created_at, Date))
+        )
+        return {
+            "total_sales": total_sales or 0,
+            "order_count": order_count,
+            "revenue": dict(revenue.all()),
+            "spent": dict(spent.all()),
+            "days": {day: (total, count) for day, total, count in days.all()},
+        }
+
+
+async def test_reports_match_order_history(group_commit, client, seed, monkeypatch):
+    from core.config import settings
+
+    await seed.create_inventory("apple", 1000, price=1.25)
+    await seed.create_inventory("pear", 1000, price=2.5)
+    await seed.create_inventory("fig", 10, price=4.0)
+    customers = [await seed.create_customer(index) for index in range(3)]
+
+    # Direct placement
+    monkeypatch.setattr(settings, "ORDER_GROUP_COMMIT", False)
+    for index, customer in enumerate(customers):
+        response = await client.post(
+            "/orders/place-order",
+            json=basket(seed.unit_name, ("apple", index + 1), ("pear", 2)),
+            headers=customer,
+        )
+        assert response.status_code == 200, response.text
+
+    # Group commit; the fig orders outgrow its stock, so some fail inside their batch
+    monkeypatch.setattr(settings, "ORDER_GROUP_COMMIT", True)
+    responses = await asyncio.gather(*[
+        client.post(
+            "/orders/place-order",
+            json=basket(seed.unit_name, ("pear", 1), ("fig", 3), ("apple", index % 4 + 1)),
+            headers=customers[index % len(customers)],
+        )
+        for index in range(12)
+    ])
+    codes = [response.status_code for response in responses]
+    assert set(codes) == {200, 400}, codes
+
+    # Bulk import, with one line rejected for an unknown item
+    lines = [basket(seed.unit_name, ("apple", 2), ("pear", 1)) for _ in range(4)]
+    lines.append(basket(seed.unit_name, ("plum", 1)))
+    response = await client.post(
+        "/orders/bulk", content="\n".join(json.dumps(line) for line in lines), headers=customers[0]
+    )
+    assert response.status_code == 200, response.text
+    statuses = [json.loads(line)["status"] for line in response.text.splitlines()]
+    assert statuses == ["created"] * 4 + ["error"]
+
+    expected = await history()
+
+    response = await client.get("/financial-reports/sales-report", headers=seed.admin)
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert report["order_count"] == expected["order_count"]
+    assert report["total_sales"] == pytest.approx(expected["total_sales"])
+
+    response = await client.get("/financial-reports/revenue-by-product", headers=seed.admin)
+    assert response.status_code == 200, response.text
+    revenue = {row["product_name"]: row["total_revenue"] for row in response.json()}
+    assert revenue == pytest.approx(expected["revenue"])
+
+    response = await client.get("/financial-reports/top-customers", headers=seed.admin)
+    assert response.status_code == 200, response.text
+    spent = {row["customer_name"]: row["total_spent"] for row in response.json()}
+    assert spent == pytest.approx(expected["spent"])
+
+    first_day, last_day = min(expected["days"]), max(expected["days"])
+    response = await client.get(
+        "/financial-reports/sales-report/timeseries",
+        params={"start": first_day.isoformat(), "end": (last_day + timedelta(days=1)).isoformat()},
+        headers=seed.admin,
+    )
+    assert response.status_code == 200, response.text
+    points = {
+        point["period_start"]: (point["total_sales"], point["order_count"])
+        for point in response.json()
+        if point["order_count"]
+    }
+    assert points.keys() == {day.isoformat() for day in expected["days"]}
+    for day, (total, count) in expected["days"].items():
+        assert points[day.isoformat()] == (pytest.approx(total), count)
@@ -0,0 +1,111 @@
+"""
+Concurrent order placement must never sell more than is in stock.
+Each run reports its throughput (shown with `pytest -s`); see
+bench/stock_contention.py for a longer measurement.
+"""
+import asyncio
+import time
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+ORDERS = 120
+STOCK = 40
+
+
+@pytest.fixture(params=[False, True], ids=["direct", "group-commit"])
+def group_commit(request, monkeypatch):
+    from core.config import settings
+
+    monkeypatch.setattr(settings, "ORDER_GROUP_COMMIT", request.param)
+    return request.param
+
+
+def report_throughput(case: str, group_commit: bool, requests: int, elapsed: float) -> None:
+    mode = "group commit" if group_commit else "direct"
+    print(f"\n{case}, {mode}: {requests / elapsed:.1f} orders/s ({requests} requests in {elapsed:.2f} s)")
+
+
+async def place(client, headers, unit_name, items):
+    return await client.post(
+        "/orders/place-order",
+        json={
+            "unit_name": unit_name,
+            "order_type": "takeaway",
+            "items": [{"inventory_name": name, "quantity": quantity} for name, quantity in items],
+        },
+        headers=headers,
+    )
+
+
+async def stock(client, headers) -> dict:
+    response = await client.get("/inventory/", headers=headers)
+    assert response.status_code == 200, response.text
+    return {item["name"]: item["quantity"] for item in response.json()}
+
+
+async def sold(unit_id) -> dict:
+    from sqlalchemy import func, select
+    from db.models import Inventory, OrderItem
+    from db.session import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Inventory.name, func.sum(OrderItem.quantity))
+            .join(OrderItem, OrderItem.inventory_id == Inventory.id)
+            .where(Inventory.unit_id == unit_id)
+            .group_by(Inventory.name)
+        )
+        return dict(result.all())
+
+
+async def test_single_item_is_not_oversold(group_commit, client, seed):
+    await seed.create_inventory("widget", STOCK)
+    customers = [await seed.create_customer(i) for i in range(4)]
+
+    started = time.perf_counter()
+    responses = await asyncio.gather(*[
+        place(client, customers[i % len(customers)], seed.unit_name, [("widget", 1)])
+        for i in range(ORDERS)
+    ])
+    report_throughput("single item", group_commit, ORDERS, time.perf_counter() - started)
+
+    codes = [response.status_code for response in responses]
+    assert codes.count(200) == STOCK
+    assert codes.count(400) == ORDERS - STOCK
+    assert (await stock(client, seed.admin))["widget"] == 0
+    assert (await sold(seed.unit_id))["widget"] == STOCK
+
+
+async def test_overlapping_baskets_are_not_oversold(group_commit, client, seed):
+    # Baskets name the same rows in opposite orders, which would deadlock without
+    # the id-ordered locking
+    await seed.create_inventory("apple", STOCK)
+    await seed.create_inventory("pear", STOCK)
+    customer = await seed.create_customer(0)
+    baskets = [[("apple", 1), ("pear", 2)], [("pear", 1), ("apple", 2)], [("apple", 3)]]
+
+    started = time.perf_counter()
+    responses = await asyncio.gather(*[
+        place(client, customer, seed.unit_name, baskets[i % len(baskets)]) for i in range(ORDERS)
+    ])
+    report_throughput("overlapping", group_commit, ORDERS, time.perf_counter() - started)
+
+    assert {response.status_code for response in responses} <= {200, 400}
+    left = await stock(client, seed.admin)
+    taken = await sold(seed.unit_id)
+    for name in ("apple", "pear"):
+        assert left[name] >= 0
+        assert left[name] + taken.get(name, 0) == STOCK
+
+
+async def test_non_positive_quantities_are_rejected(group_commit, client, seed):
+    await seed.create_inventory("widget", STOCK)
+    customer = await seed.create_customer(0)
+
+    for quantity in (0, -5):
+        response = await place(client, customer, seed.unit_name, [("widget", quantity)])
+        assert response.status_code == 422, response.text
+
+    assert (await stock(client, seed.admin))["widget"] == STOCK
@@ -0,0 +1,35 @@
+"""
+Access token revocation: the cached token version follows only committed bumps.
+"""
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_rolled_back_revocation_keeps_tokens_valid(client, seed):
+    from sqlmodel import select
+    from db.models import User
+    from db.session import AsyncSessionLocal
+    from utils.utils import revoke_user_tokens, token_versions
+
+    customer = await seed.create_customer(0)
+    # A valid token reaches the endpoint, which finds no such order
+    response = await client.get("/orders/999999", headers=customer)
+    assert response.status_code == 404, response.text
+
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(User).where(User.email == "customer0@example.com"))).scalars().one()
+        user_id, version = user.id, user.token_version
+        revoke_user_tokens(user)
+        await db.rollback()
+    assert token_versions.get(user_id) in (None, version)
+    response = await client.get("/orders/999999", headers=customer)
+    assert response.status_code == 404, response.text
+
+    async with AsyncSessionLocal() as db:
+        user = await db.get(User, user_id)
+        revoke_user_tokens(user)
+        await db.commit()
+    assert token_versions.get(user_id) == version + 1
+    response = await client.get("/orders/999999", headers=customer)
+    assert response.status_code == 401, response.text